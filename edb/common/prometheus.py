@@ -371,8 +371,20 @@ class BaseLabeledCounter(BaseMetric):
         self._metric_values = {}
         self._metric_created = {}
 
+    def labels(self, *labels: str) -> BoundLabeledCounter:
+        """Return a handle to the metric with all label values fixed.
+
+        The label values are validated once here rather than on every
+        update, which makes the handle cheaper to use on hot paths.
+        """
+        self._validate_label_values(self._labels, labels)
+        return BoundLabeledCounter(self, labels)
+
     def inc(self, value: float = 1.0, *labels: str) -> None:
         self._validate_label_values(self._labels, labels)
+        self._inc(value, labels)
+
+    def _inc(self, value: float, labels: tuple[str, ...]) -> None:
         if value < 0:
             raise ValueError(
                 'counter cannot be incremented with a negative value')
@@ -453,8 +465,11 @@ class LabeledGauge(BaseLabeledCounter):
     _render_created = False
     _suffix = ''
 
-    def inc(self, value: float = 1.0, *labels: str) -> None:
+    def labels(self, *labels: str) -> BoundLabeledGauge:
         self._validate_label_values(self._labels, labels)
+        return BoundLabeledGauge(self, labels)
+
+    def _inc(self, value: float, labels: tuple[str, ...]) -> None:
         try:
             self._metric_values[labels] += value
         except KeyError:
@@ -466,6 +481,9 @@ class LabeledGauge(BaseLabeledCounter):
 
     def set(self, value: float = 1.0, *labels: str) -> None:
         self._validate_label_values(self._labels, labels)
+        self._set(value, labels)
+
+    def _set(self, value: float, labels: tuple[str, ...]) -> None:
         self._metric_values[labels] = value
         try:
             self._metric_created[labels]
@@ -571,9 +589,15 @@ class LabeledHistogram(BaseHistogram):
         self._metric_values = {}
         self._metric_created = {}
 
+    def labels(self, *labels: str) -> BoundLabeledHistogram:
+        self._validate_label_values(self._labels, labels)
+        return BoundLabeledHistogram(self, labels)
+
     def observe(self, value: float, *labels: str) -> None:
         self._validate_label_values(self._labels, labels)
+        self._observe(value, labels)
 
+    def _observe(self, value: float, labels: tuple[str, ...]) -> None:
         try:
             metric = self._metric_values[labels]
         except KeyError:
@@ -628,6 +652,57 @@ class LabeledHistogram(BaseHistogram):
                 )
 
 
+class BoundLabeledCounter:
+
+    __slots__ = ('_metric', '_label_values')
+
+    _metric: BaseLabeledCounter
+    _label_values: tuple[str, ...]
+
+    def __init__(
+        self,
+        metric: BaseLabeledCounter,
+        label_values: tuple[str, ...],
+    ) -> None:
+        self._metric = metric
+        self._label_values = label_values
+
+    def inc(self, value: float = 1.0) -> None:
+        self._metric._inc(value, self._label_values)
+
+
+class BoundLabeledGauge(BoundLabeledCounter):
+
+    __slots__ = ()
+
+    _metric: LabeledGauge
+
+    def dec(self, value: float = 1.0) -> None:
+        self._metric._inc(-value, self._label_values)
+
+    def set(self, value: float) -> None:
+        self._metric._set(value, self._label_values)
+
+
+class BoundLabeledHistogram:
+
+    __slots__ = ('_metric', '_label_values')
+
+    _metric: LabeledHistogram
+    _label_values: tuple[str, ...]
+
+    def __init__(
+        self,
+        metric: LabeledHistogram,
+        label_values: tuple[str, ...],
+    ) -> None:
+        self._metric = metric
+        self._label_values = label_values
+
+    def observe(self, value: float) -> None:
+        self._metric._observe(value, self._label_values)
+
+
 @functools.lru_cache(maxsize=1024)
 def _format_desc(desc: str) -> str:
     return desc.replace('\\', r'\\').replace('\n', r'\n')
@@ -227,6 +227,15 @@ class Block(typing.Generic[C]):
         return self.conn_stack.popleft()
 
     async def acquire(self) -> C:
+        # Skip the waiters' queue if we can grab a connection from the
+        # stack immediately - this is not completely fair, but it's
+        # extremely hard to always take the shortcut and starve the queue
+        # without blocking the main loop, so we are fine here. (This is
+        # also how asyncio.Queue is implemented.)  Nothing is awaited on
+        # this path, so there is no need to count ourselves as a waiter.
+        if self.conn_stack:
+            return self.conn_stack.pop()
+
         # There can be a race between a waiter scheduled for to wake up
         # and a connection being stolen (due to quota being enforced,
         # for example).  In which case the waiter might get finally
@@ -235,11 +244,6 @@ class Block(typing.Generic[C]):
         try:
             attempts = 0
 
-            # Skip the waiters' queue if we can grab a connection from the
-            # stack immediately - this is not completely fair, but it's
-            # extremely hard to always take the shortcut and starve the queue
-            # without blocking the main loop, so we are fine here. (This is
-            # also how asyncio.Queue is implemented.)
             while not self.conn_stack:
                 waiter = self.loop.create_future()
 
@@ -1137,6 +1141,24 @@ class Pool(BasePool[C]):
 
         return conn
 
+    async def acquire_healthy(
+        self, dbname: str, is_healthy: typing.Callable[[C], bool]
+    ) -> C:
+        # Same as acquire(), but first drop idle connections that are
+        # already known to be broken from the top of the stack (where
+        # acquire() takes connections from), so that they are never handed
+        # out.  This is all done synchronously without a release() and
+        # re-acquire() round-trip for each broken connection.
+        block = self._blocks.get(dbname)
+        if block is not None:
+            stack = block.conn_stack
+            while stack and not is_healthy(stack[-1]):
+                # Like release(discard=True), replace the connection with a
+                # new one for the tasks that may be waiting in this block.
+                self._schedule_discard(block, stack.pop())
+                self._schedule_new_conn(block)
+        return await self.acquire(dbname)
+
     def release(self, dbname: str, conn: C, *, discard: bool=False) -> None:
         try:
             block = self._blocks[dbname]
@@ -1268,6 +1268,9 @@ cdef class DatabaseIndex:
     def iter_dbs(self):
         return iter(self._dbs.values())
 
+    def get_db_names(self):
+        return set(self._dbs)
+
     async def _save_system_overrides(self, conn, spec):
         data = config.to_json(
             spec,
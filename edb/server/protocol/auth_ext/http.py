@@ -18,6 +18,7 @@
 
 
 import datetime
+import functools
 import http
 import http.cookies
 import json
@@ -25,17 +26,21 @@ import logging
 import urllib.parse
 import base64
 import hashlib
+import hmac
 import os
+import string
 import mimetypes
-import uuid
+import secrets
+import time
 
 from typing import *
 
 import aiosmtplib
-from jwcrypto import jwk, jwt
+from jwcrypto import jwk, jws, jwt
 
 from edb import errors as edb_errors
 from edb.common import debug
+from edb.common import lru
 from edb.common import markup
 from edb.ir import statypes
 from edb.server import tenant as edbtenant
@@ -46,6 +51,109 @@ from . import oauth, local, errors, util, pkce, ui, config, email as auth_emails
 
 logger = logging.getLogger('edb.server')
 
+_UTC = datetime.timezone.utc
+_datetime_now = datetime.datetime.now
+
+# Verification tokens are accepted for 24 hours after they are issued.
+_VERIFICATION_TOKEN_MAX_AGE = 24 * 60 * 60
+
+_JWT_HEADER = {"alg": "HS256"}
+# The compact-serialized form of _JWT_HEADER, as emitted by jwcrypto.
+_JWT_HEADER_SEGMENT = base64.urlsafe_b64encode(
+    json.dumps(_JWT_HEADER, separators=(",", ":"), sort_keys=True).encode()
+).rstrip(b"=").decode()
+# Clock skew tolerated for "exp" and "nbf", matching jwcrypto's default.
+_JWT_LEEWAY = 60
+
+
+class _Signer:
+    """Issues HS256 tokens signed with a single, already resolved key.
+
+    HS256 is simple enough that tokens are assembled directly with
+    hmac, instead of going through jwcrypto's generic JWS machinery.
+    The result is a regular compact JWS that jwcrypto verifies as usual.
+    """
+
+    __slots__ = ("key", "_key_bytes")
+
+    def __init__(self, key: jwk.JWK, key_bytes: bytes):
+        self.key = key
+        self._key_bytes = key_bytes
+
+    def sign(self, claims: dict[str, Any]) -> str:
+        payload = base64.urlsafe_b64encode(
+            json.dumps(claims).encode()
+        ).rstrip(b"=")
+        signing_input = f"{_JWT_HEADER_SEGMENT}.{payload.decode()}"
+        signature = base64.urlsafe_b64encode(
+            hmac.digest(self._key_bytes, signing_input.encode(), "sha256")
+        ).rstrip(b"=")
+        return f"{signing_input}.{signature.decode()}"
+
+
+@functools.lru_cache(maxsize=64)
+def _make_signer(auth_signing_key: str) -> _Signer:
+    key_bytes = auth_signing_key.encode()
+    # JWK expects "k" in unpadded base64url (RFC 7518, section 6.4.1).
+    k = base64.urlsafe_b64encode(key_bytes).rstrip(b"=")
+    return _Signer(jwk.JWK(kty="oct", k=k.decode("ascii")), key_bytes)
+
+
+# Claims of successfully verified tokens, keyed by the signing key and a
+# digest of the token.  Each entry carries its own deadline, bounded by
+# the token's "exp" claim, so that expired tokens are never served.
+_CLAIMS_CACHE_MAX_TTL = 3600.0
+_claims_cache = lru.LRUMapping(maxsize=1024)
+
+
+class _ConfigSnapshot(NamedTuple):
+    db_config: Any
+    user_config_spec: Any
+    ui_config: Optional[config.UIConfig]
+    providers: Optional[frozenset[config.ProviderConfig]]
+    password_provider: Optional[config.ProviderConfig]
+    auth_signing_key: Optional[str]
+    token_time_to_live: Optional[datetime.timedelta]
+    ui_render_kwargs: Mapping[str, Optional[str]]
+
+
+# Auth UI config, configured providers and token settings for each
+# database, keyed by id(db).  A snapshot is only used while the
+# database still holds the same db_config and user_config_spec objects
+# it was computed from; both are replaced, never mutated, when the
+# configuration changes.
+_config_snapshots = lru.LRUMapping(maxsize=256)
+
+# Provider clients only capture the database and its provider config,
+# so they are shared between requests for as long as that config is
+# unchanged (see _config_snapshots above).
+_client_cache = lru.LRUMapping(maxsize=256)
+
+_Client = TypeVar("_Client", local.Client, oauth.Client)
+
+# Static UI assets do not change for the lifetime of the process, so
+# they are read from disk once and served from memory afterwards.
+_STATIC_DIR = os.path.realpath(
+    os.path.join(os.path.dirname(__file__), '_static')
+)
+_static_cache: dict[str, tuple[bytes, bytes]] = {}
+
+
+def _guess_static_content_types() -> dict[str, bytes]:
+    try:
+        filenames = os.listdir(_STATIC_DIR)
+    except FileNotFoundError:
+        return {}
+    return {
+        filename: (
+            mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        ).encode()
+        for filename in filenames
+    }
+
+
+_STATIC_CONTENT_TYPES = _guess_static_content_types()
+
 
 class Router:
     test_url: Optional[str]
@@ -72,63 +180,15 @@ class Router:
             else None
         )
 
-        handler_args = (request, response)
+        route = tuple(args)
         try:
-            match args:
-                # API routes
-                case ("authorize",):
-                    return await self.handle_authorize(*handler_args)
-                case ("callback",):
-                    return await self.handle_callback(*handler_args)
-                case ("token",):
-                    return await self.handle_token(*handler_args)
-                case ("register",):
-                    return await self.handle_register(*handler_args)
-                case ("authenticate",):
-                    return await self.handle_authenticate(*handler_args)
-                case ("verify",):
-                    return await self.handle_verify(*handler_args)
-                case ("resend-verification-email",):
-                    return await self.handle_resend_verification_email(
-                        *handler_args
-                    )
-                case ('send-reset-email',):
-                    return await self.handle_send_reset_email(*handler_args)
-                case ('reset-password',):
-                    return await self.handle_reset_password(*handler_args)
-
-                # UI routes
-                case ('ui', 'signin'):
-                    return await self.handle_ui_signin(*handler_args)
-                case ('ui', 'signup'):
-                    return await self.handle_ui_signup(*handler_args)
-                case ('ui', 'forgot-password'):
-                    return await self.handle_ui_forgot_password(*handler_args)
-                case ('ui', 'reset-password'):
-                    return await self.handle_ui_reset_password(*handler_args)
-                case ("ui", "verify"):
-                    return await self.handle_ui_verify(*handler_args)
-                case ("ui", "resend-verification"):
-                    return await self.handle_ui_resend_verification(
-                        *handler_args
-                    )
-                case ('ui', '_static', filename):
-                    filepath = os.path.join(
-                        os.path.dirname(__file__), '_static', filename
-                    )
-                    try:
-                        with open(filepath, 'rb') as f:
-                            response.status = http.HTTPStatus.OK
-                            response.content_type = (
-                                mimetypes.guess_type(filename)[0]
-                                or 'application/octet-stream'
-                            ).encode()
-                            response.body = f.read()
-                    except FileNotFoundError:
-                        response.status = http.HTTPStatus.NOT_FOUND
-
-                case _:
-                    raise errors.NotFound("Unknown auth endpoint")
+            handler = self._routes.get(route)
+            if handler is not None:
+                await handler(self, request, response)
+            elif len(route) == 3 and route[:2] == ('ui', '_static'):
+                self._handle_ui_static(response, route[2])
+            else:
+                raise errors.NotFound("Unknown auth endpoint")
 
         except errors.NotFound as ex:
             _fail_with_error(
@@ -190,18 +250,14 @@ class Router:
             )
 
     async def handle_authorize(self, request: Any, response: Any):
-        query = urllib.parse.parse_qs(
-            request.url.query.decode("ascii") if request.url.query else ""
-        )
+        query = _parse_query(request.url.query)
         provider_name = _get_search_param(query, "provider")
         redirect_to = _get_search_param(query, "redirect_to")
         redirect_to_on_signup = _maybe_get_search_param(
             query, "redirect_to_on_signup"
         )
         challenge = _get_search_param(query, "challenge")
-        oauth_client = oauth.Client(
-            db=self.db, provider_name=provider_name, base_url=self.test_url
-        )
+        oauth_client = self._get_oauth_client(provider_name)
         await pkce.create(self.db, challenge)
         authorize_url = await oauth_client.get_authorize_url(
             redirect_uri=self._get_callback_url(),
@@ -216,18 +272,13 @@ class Router:
         if request.method == b"POST" and (
             request.content_type == b"application/x-www-form-urlencoded"
         ):
-            form_data = urllib.parse.parse_qs(request.body.decode())
-            state = _maybe_get_form_field(form_data, "state")
-            code = _maybe_get_form_field(form_data, "code")
-
-            error = _maybe_get_form_field(form_data, "error")
-            error_description = _maybe_get_form_field(
-                form_data, "error_description"
-            )
+            form_data = _parse_urlencoded(request.body)
+            state = form_data.get("state")
+            code = form_data.get("code")
+            error = form_data.get("error")
+            error_description = form_data.get("error_description")
         elif request.url.query is not None:
-            query = urllib.parse.parse_qs(
-                request.url.query.decode("ascii") if request.url.query else ""
-            )
+            query = _parse_query(request.url.query)
             state = _maybe_get_search_param(query, "state")
             code = _maybe_get_search_param(query, "code")
             error = _maybe_get_search_param(query, "error")
@@ -244,21 +295,21 @@ class Router:
                 "Provider did not include the 'state' parameter in " "callback"
             )
 
-        if error is not None:
-            try:
-                claims = self._verify_and_extract_claims(state)
-                redirect_to = cast(str, claims["redirect_to"])
-            except Exception:
-                raise errors.InvalidData("Invalid state token")
+        try:
+            claims = self._verify_and_extract_claims(state)
+            redirect_to = cast(str, claims["redirect_to"])
+        except Exception:
+            raise errors.InvalidData("Invalid state token")
 
+        if error is not None:
             params = {
                 "error": error,
             }
             if error_description is not None:
                 params["error_description"] = error_description
-            response.custom_headers[
-                "Location"
-            ] = f"{redirect_to}?{urllib.parse.urlencode(params)}"
+            response.custom_headers["Location"] = _with_appended_qs(
+                redirect_to, params
+            )
             response.status = http.HTTPStatus.FOUND
             return
 
@@ -268,45 +319,33 @@ class Router:
             )
 
         try:
-            claims = self._verify_and_extract_claims(state)
             provider_name = cast(str, claims["provider"])
-            redirect_to = cast(str, claims["redirect_to"])
             redirect_to_on_signup = cast(
                 Optional[str], claims.get("redirect_to_on_signup")
             )
             challenge = cast(str, claims["challenge"])
         except Exception:
             raise errors.InvalidData("Invalid state token")
-        oauth_client = oauth.Client(
-            db=self.db,
-            provider_name=provider_name,
-            base_url=self.test_url,
-        )
+        oauth_client = self._get_oauth_client(provider_name)
         (
             identity,
             new_identity,
             auth_token,
             refresh_token,
         ) = await oauth_client.handle_callback(code, self._get_callback_url())
-        pkce_code = await pkce.link_identity_challenge(
-            self.db, identity.id, challenge
+        pkce_code = await pkce.link_identity_challenge_with_tokens(
+            self.db,
+            identity_id=identity.id,
+            challenge=challenge,
+            auth_token=auth_token,
+            refresh_token=refresh_token,
         )
-        if auth_token or refresh_token:
-            await pkce.add_provider_tokens(
-                self.db,
-                id=pkce_code,
-                auth_token=auth_token,
-                refresh_token=refresh_token,
-            )
-        parsed_url = urllib.parse.urlparse(
+        new_url = _with_appended_qs(
             (redirect_to_on_signup or redirect_to)
             if new_identity
-            else redirect_to
+            else redirect_to,
+            {"code": pkce_code},
         )
-        query_params = urllib.parse.parse_qs(parsed_url.query)
-        query_params["code"] = [pkce_code]
-        new_query = urllib.parse.urlencode(query_params, doseq=True)
-        new_url = parsed_url._replace(query=new_query).geturl()
 
         session_token = self._make_session_token(identity.id)
         response.status = http.HTTPStatus.FOUND
@@ -314,21 +353,18 @@ class Router:
         _set_cookie(response, "edgedb-session", session_token)
 
     async def handle_token(self, request: Any, response: Any):
-        query = urllib.parse.parse_qs(
-            request.url.query.decode("ascii") if request.url.query else ""
-        )
+        query = _parse_query(request.url.query)
         code = _get_search_param(query, "code")
         verifier = _get_search_param(query, "verifier")
 
         verifier_size = len(verifier)
-
-        if verifier_size < 43:
-            raise errors.InvalidData(
-                "Verifier must be at least 43 characters long"
-            )
-        if verifier_size > 128:
+        if not 43 <= verifier_size <= 128:
+            if verifier_size < 43:
+                raise errors.InvalidData(
+                    "Verifier must be at least 43 characters long"
+                )
             raise errors.InvalidData(
-                "Verifier must be shorter than 128 " "characters long"
+                "Verifier must be shorter than 128 characters long"
             )
         try:
             pkce_object = await pkce.get_by_id(self.db, code)
@@ -343,7 +379,9 @@ class Router:
             hashed_verifier
         ).rstrip(b'=')
 
-        if base64_url_encoded_verifier.decode() == pkce_object.challenge:
+        if hmac.compare_digest(
+            base64_url_encoded_verifier, pkce_object.challenge.encode()
+        ):
             await pkce.delete(self.db, code)
             session_token = self._make_session_token(pkce_object.identity_id)
             response.status = http.HTTPStatus.OK
@@ -368,9 +406,7 @@ class Router:
         if register_provider_name is None:
             raise errors.InvalidData('Missing "provider" in register request')
 
-        local_client = local.Client(
-            db=self.db, provider_name=register_provider_name
-        )
+        local_client = self._get_local_client(register_provider_name)
         require_verification = local_client.provider.config.require_verification
         pkce_code: Optional[str] = None
 
@@ -381,8 +417,7 @@ class Router:
                     raise errors.InvalidData(
                         'Missing "challenge" in register request'
                     )
-                await pkce.create(self.db, maybe_challenge)
-                pkce_code = await pkce.link_identity_challenge(
+                pkce_code = await pkce.create_and_link(
                     self.db, identity.id, maybe_challenge
                 )
 
@@ -397,18 +432,15 @@ class Router:
                 maybe_redirect_to=maybe_redirect_to,
             )
 
-            now_iso8601 = datetime.datetime.now(
-                datetime.timezone.utc
-            ).isoformat()
+            now_iso8601 = _utc_now_iso8601()
             if maybe_redirect_to is not None:
                 response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(
+                response.custom_headers["Location"] = _with_appended_qs(
+                    maybe_redirect_to,
                     {"verification_email_sent_at": now_iso8601}
                     if require_verification
-                    else {"code": pkce_code}
+                    else {"code": pkce_code},
                 )
-                redirect_url = f"{maybe_redirect_to}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
             else:
                 response.status = http.HTTPStatus.CREATED
                 response.content_type = b"application/json"
@@ -425,12 +457,12 @@ class Router:
                 "redirect_on_failure", maybe_redirect_to
             )
             if redirect_on_failure is not None:
-                response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(
-                    {"error": str(ex), "email": data.get('email', '')}
+                _redirect_error(
+                    response,
+                    redirect_on_failure,
+                    ex,
+                    email=data.get('email', ''),
                 )
-                redirect_url = f"{redirect_on_failure}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
             else:
                 raise ex
 
@@ -443,11 +475,8 @@ class Router:
         maybe_challenge = data.get("challenge")
         if maybe_challenge is None:
             raise errors.InvalidData('Missing "challenge" in register request')
-        await pkce.create(self.db, maybe_challenge)
 
-        local_client = local.Client(
-            db=self.db, provider_name=authenticate_provider_name
-        )
+        local_client = self._get_local_client(authenticate_provider_name)
         try:
             local_identity = await local_client.authenticate(data)
             verified_at = await local_client.get_verified_by_identity_id(
@@ -459,20 +488,16 @@ class Router:
             ):
                 raise errors.VerificationRequired()
 
-            pkce_code = await pkce.link_identity_challenge(
+            pkce_code = await pkce.create_and_link(
                 self.db, local_identity.id, maybe_challenge
             )
             session_token = self._make_session_token(local_identity.id)
             _set_cookie(response, "edgedb-session", session_token)
             if data.get("redirect_to") is not None:
                 response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(
-                    {
-                        "code": pkce_code,
-                    }
+                response.custom_headers["Location"] = _with_appended_qs(
+                    data["redirect_to"], {"code": pkce_code}
                 )
-                redirect_url = f"{data['redirect_to']}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
             else:
                 response.status = http.HTTPStatus.OK
                 response.content_type = b"application/json"
@@ -486,15 +511,12 @@ class Router:
                 "redirect_on_failure", data.get("redirect_to")
             )
             if redirect_on_failure is not None:
-                response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(
-                    {
-                        "error": str(ex),
-                        "email": data.get('email', ''),
-                    }
+                _redirect_error(
+                    response,
+                    redirect_on_failure,
+                    ex,
+                    email=data.get('email', ''),
                 )
-                redirect_url = f"{redirect_on_failure}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
             else:
                 raise ex
 
@@ -531,8 +553,7 @@ class Router:
 
         match (maybe_challenge, maybe_redirect_to):
             case (str(challenge), str(redirect_to)):
-                await pkce.create(self.db, challenge)
-                code = await pkce.link_identity_challenge(
+                code = await pkce.create_and_link(
                     self.db, identity_id, challenge
                 )
                 response.status = http.HTTPStatus.FOUND
@@ -540,8 +561,7 @@ class Router:
                     redirect_to, {"code": [code]}
                 )
             case (str(challenge), _):
-                await pkce.create(self.db, challenge)
-                code = await pkce.link_identity_challenge(
+                code = await pkce.create_and_link(
                     self.db, identity_id, challenge
                 )
                 response.status = http.HTTPStatus.OK
@@ -566,7 +586,7 @@ class Router:
             maybe_redirect_to,
         ) = self._get_data_from_verification_token(data["verification_token"])
 
-        local_client = local.Client(db=self.db, provider_name=data["provider"])
+        local_client = self._get_local_client(data["provider"])
         email = await local_client.get_email_by_identity_id(identity_id)
         if email is None:
             await auth_emails.send_fake_email(self.tenant)
@@ -586,7 +606,7 @@ class Router:
         data = self._get_data_from_request(request)
 
         _check_keyset(data, {"provider", "reset_url"})
-        local_client = local.Client(db=self.db, provider_name=data["provider"])
+        local_client = self._get_local_client(data["provider"])
 
         try:
             try:
@@ -597,10 +617,9 @@ class Router:
 
                 new_reset_token = self._make_secret_token(identity.id, secret)
 
-                reset_token_params = urllib.parse.urlencode(
-                    {"reset_token": new_reset_token}
+                reset_url = _with_appended_qs(
+                    data["reset_url"], {"reset_token": new_reset_token}
                 )
-                reset_url = f"{data['reset_url']}?{reset_token_params}"
 
                 await auth_emails.send_password_reset_email(
                     db=self.db,
@@ -618,9 +637,9 @@ class Router:
 
             if data.get("redirect_to") is not None:
                 response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(return_data)
-                redirect_url = f"{data['redirect_to']}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
+                response.custom_headers["Location"] = _with_appended_qs(
+                    data["redirect_to"], return_data
+                )
             else:
                 response.status = http.HTTPStatus.OK
                 response.content_type = b"application/json"
@@ -637,15 +656,12 @@ class Router:
                 "redirect_on_failure", data.get("redirect_to")
             )
             if redirect_on_failure is not None:
-                response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(
-                    {
-                        "error": str(ex),
-                        "email": data.get('email', ''),
-                    }
+                _redirect_error(
+                    response,
+                    redirect_on_failure,
+                    ex,
+                    email=data.get('email', ''),
                 )
-                redirect_url = f"{redirect_on_failure}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
             else:
                 raise ex
 
@@ -653,7 +669,7 @@ class Router:
         data = self._get_data_from_request(request)
 
         _check_keyset(data, {"provider", "reset_token"})
-        local_client = local.Client(db=self.db, provider_name=data["provider"])
+        local_client = self._get_local_client(data["provider"])
 
         try:
             reset_token = data['reset_token']
@@ -668,14 +684,13 @@ class Router:
             _set_cookie(response, "edgedb-session", session_token)
             if data.get("redirect_to") is not None:
                 response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(
+                response.custom_headers["Location"] = _with_appended_qs(
+                    data["redirect_to"],
                     {
                         "identity_id": identity.id,
                         "auth_token": session_token,
-                    }
+                    },
                 )
-                redirect_url = f"{data['redirect_to']}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
             else:
                 response.status = http.HTTPStatus.OK
                 response.content_type = b"application/json"
@@ -690,15 +705,12 @@ class Router:
                 "redirect_on_failure", data.get("redirect_to")
             )
             if redirect_on_failure is not None:
-                response.status = http.HTTPStatus.FOUND
-                redirect_params = urllib.parse.urlencode(
-                    {
-                        "error": str(ex),
-                        "reset_token": data.get('reset_token', ''),
-                    }
+                _redirect_error(
+                    response,
+                    redirect_on_failure,
+                    ex,
+                    reset_token=data.get('reset_token', ''),
                 )
-                redirect_url = f"{redirect_on_failure}?{redirect_params}"
-                response.custom_headers["Location"] = redirect_url
             else:
                 raise ex
 
@@ -709,20 +721,14 @@ class Router:
             response.status = http.HTTPStatus.NOT_FOUND
             response.body = b'Auth UI not enabled'
         else:
-            providers = util.maybe_get_config(
-                self.db,
-                "ext::auth::AuthConfig::providers",
-                frozenset,
-            )
+            providers = self._get_providers()
             if providers is None or len(providers) == 0:
                 raise errors.MissingConfiguration(
                     'ext::auth::AuthConfig::providers',
                     'No providers are configured',
                 )
 
-            query = urllib.parse.parse_qs(
-                request.url.query.decode("ascii") if request.url.query else ""
-            )
+            query = _parse_query(request.url.query)
 
             maybe_challenge = _get_pkce_challenge(
                 response=response,
@@ -743,10 +749,7 @@ class Router:
                 error_message=_maybe_get_search_param(query, 'error'),
                 email=_maybe_get_search_param(query, 'email'),
                 challenge=maybe_challenge,
-                app_name=ui_config.app_name,
-                logo_url=ui_config.logo_url,
-                dark_logo_url=ui_config.dark_logo_url,
-                brand_color=ui_config.brand_color,
+                **self._get_ui_render_kwargs(),
             )
 
     async def handle_ui_signup(self, request: Any, response: Any):
@@ -755,20 +758,14 @@ class Router:
             response.status = http.HTTPStatus.NOT_FOUND
             response.body = b'Auth UI not enabled'
         else:
-            providers = util.maybe_get_config(
-                self.db,
-                "ext::auth::AuthConfig::providers",
-                frozenset,
-            )
+            providers = self._get_providers()
             if providers is None or len(providers) == 0:
                 raise errors.MissingConfiguration(
                     'ext::auth::AuthConfig::providers',
                     'No providers are configured',
                 )
 
-            query = urllib.parse.parse_qs(
-                request.url.query.decode("ascii") if request.url.query else ""
-            )
+            query = _parse_query(request.url.query)
 
             maybe_challenge = _get_pkce_challenge(
                 response=response,
@@ -791,16 +788,12 @@ class Router:
                 error_message=_maybe_get_search_param(query, 'error'),
                 email=_maybe_get_search_param(query, 'email'),
                 challenge=maybe_challenge,
-                app_name=ui_config.app_name,
-                logo_url=ui_config.logo_url,
-                dark_logo_url=ui_config.dark_logo_url,
-                brand_color=ui_config.brand_color,
+                **self._get_ui_render_kwargs(),
             )
 
     async def handle_ui_forgot_password(self, request: Any, response: Any):
-        ui_config = self._get_ui_config()
-        password_provider = (
-            self._get_password_provider() if ui_config is not None else None
+        ui_config, password_provider = (
+            self._get_ui_config_and_password_provider()
         )
 
         if ui_config is None or password_provider is None:
@@ -811,9 +804,7 @@ class Router:
                 else b'Auth UI not enabled'
             )
         else:
-            query = urllib.parse.parse_qs(
-                request.url.query.decode("ascii") if request.url.query else ""
-            )
+            query = _parse_query(request.url.query)
 
             response.status = http.HTTPStatus.OK
             response.content_type = b'text/html'
@@ -823,16 +814,12 @@ class Router:
                 error_message=_maybe_get_search_param(query, 'error'),
                 email=_maybe_get_search_param(query, 'email'),
                 email_sent=_maybe_get_search_param(query, 'email_sent'),
-                app_name=ui_config.app_name,
-                logo_url=ui_config.logo_url,
-                dark_logo_url=ui_config.dark_logo_url,
-                brand_color=ui_config.brand_color,
+                **self._get_ui_render_kwargs(),
             )
 
     async def handle_ui_reset_password(self, request: Any, response: Any):
-        ui_config = self._get_ui_config()
-        password_provider = (
-            self._get_password_provider() if ui_config is not None else None
+        ui_config, password_provider = (
+            self._get_ui_config_and_password_provider()
         )
 
         if ui_config is None or password_provider is None:
@@ -843,9 +830,7 @@ class Router:
                 else b'Auth UI not enabled'
             )
         else:
-            query = urllib.parse.parse_qs(
-                request.url.query.decode("ascii") if request.url.query else ""
-            )
+            query = _parse_query(request.url.query)
 
             reset_token = _maybe_get_search_param(query, 'reset_token')
 
@@ -856,9 +841,8 @@ class Router:
                         secret,
                     ) = self._get_data_from_reset_token(reset_token)
 
-                    local_client = local.Client(
-                        db=self.db,
-                        provider_name=password_provider.name,
+                    local_client = self._get_local_client(
+                        password_provider.name
                     )
 
                     is_valid = await local_client.validate_reset_secret(
@@ -878,23 +862,19 @@ class Router:
                 redirect_to=ui_config.redirect_to,
                 reset_token=reset_token,
                 error_message=_maybe_get_search_param(query, 'error'),
-                app_name=ui_config.app_name,
-                logo_url=ui_config.logo_url,
-                dark_logo_url=ui_config.dark_logo_url,
-                brand_color=ui_config.brand_color,
+                **self._get_ui_render_kwargs(),
             )
 
     async def handle_ui_verify(self, request: Any, response: Any):
         error_messages: list[str] = []
-        ui_config = self._get_ui_config()
+        ui_config, password_provider = (
+            self._get_ui_config_and_password_provider()
+        )
         if ui_config is None:
             response.status = http.HTTPStatus.NOT_FOUND
             response.body = b'Auth UI not enabled'
             return
 
-        password_provider = (
-            self._get_password_provider() if ui_config is not None else None
-        )
         is_valid = True
         maybe_pkce_code: str | None = None
         redirect_to = ui_config.redirect_to_on_signup or ui_config.redirect_to
@@ -904,9 +884,7 @@ class Router:
             response.body = b'Password provider not configured'
             return
 
-        query = urllib.parse.parse_qs(
-            request.url.query.decode("ascii") if request.url.query else ""
-        )
+        query = _parse_query(request.url.query)
         maybe_verification_token = _maybe_get_search_param(
             query, "verification_token"
         )
@@ -934,17 +912,13 @@ class Router:
                     response.content_type = b"text/html"
                     response.body = ui.render_email_verification_expired_page(
                         verification_token=maybe_verification_token,
-                        app_name=ui_config.app_name,
-                        logo_url=ui_config.logo_url,
-                        dark_logo_url=ui_config.dark_logo_url,
-                        brand_color=ui_config.brand_color,
+                        **self._get_ui_render_kwargs(),
                     )
                     return
 
                 match maybe_challenge:
                     case str(ch):
-                        await pkce.create(self.db, ch)
-                        maybe_pkce_code = await pkce.link_identity_challenge(
+                        maybe_pkce_code = await pkce.create_and_link(
                             self.db,
                             identity_id,
                             ch,
@@ -983,19 +957,12 @@ class Router:
             verification_token=maybe_verification_token,
             is_valid=is_valid,
             error_messages=error_messages,
-            app_name=ui_config.app_name,
-            logo_url=ui_config.logo_url,
-            dark_logo_url=ui_config.dark_logo_url,
-            brand_color=ui_config.brand_color,
+            **self._get_ui_render_kwargs(),
         )
 
     async def handle_ui_resend_verification(self, request: Any, response: Any):
-        query = urllib.parse.parse_qs(
-            request.url.query.decode("ascii") if request.url.query else ""
-        )
-        ui_config = self._get_ui_config()
-        password_provider = (
-            self._get_password_provider() if ui_config is not None else None
+        ui_config, password_provider = (
+            self._get_ui_config_and_password_provider()
         )
         is_valid = True
 
@@ -1003,16 +970,18 @@ class Router:
             response.status = http.HTTPStatus.NOT_FOUND
             response.body = b'Password provider not configured'
             return
+
+        query = _parse_query(request.url.query)
         try:
             _check_keyset(query, {"verification_token"})
-            verification_token = query["verification_token"][0]
+            verification_token = query["verification_token"]
             (
                 identity_id,
                 _,
                 maybe_challenge,
                 maybe_redirect_to,
             ) = self._get_data_from_verification_token(verification_token)
-            local_client = local.Client(self.db, password_provider.name)
+            local_client = self._get_local_client(password_provider.name)
             email = await local_client.get_email_by_identity_id(
                 identity_id=identity_id
             )
@@ -1034,22 +1003,40 @@ class Router:
             verification_token=_maybe_get_search_param(
                 query, "verification_token"
             ),
-            app_name=ui_config.app_name,
-            logo_url=ui_config.logo_url,
-            dark_logo_url=ui_config.dark_logo_url,
-            brand_color=ui_config.brand_color,
+            **self._get_ui_render_kwargs(),
         )
 
+    def _handle_ui_static(self, response: Any, filename: str):
+        try:
+            content_type, body = _static_cache[filename]
+        except KeyError:
+            filepath = os.path.realpath(os.path.join(_STATIC_DIR, filename))
+            if os.path.commonpath([filepath, _STATIC_DIR]) != _STATIC_DIR:
+                response.status = http.HTTPStatus.NOT_FOUND
+                return
+            try:
+                with open(filepath, 'rb') as f:
+                    body = f.read()
+            except (FileNotFoundError, IsADirectoryError):
+                response.status = http.HTTPStatus.NOT_FOUND
+                return
+            content_type = _STATIC_CONTENT_TYPES.get(
+                filename, b'application/octet-stream'
+            )
+            _static_cache[filename] = (content_type, body)
+
+        response.status = http.HTTPStatus.OK
+        response.content_type = content_type
+        response.body = body
+
     def _get_callback_url(self) -> str:
         return f"{self.base_path}/callback"
 
-    def _get_auth_signing_key(self) -> jwk.JWK:
-        auth_signing_key = util.get_config(
-            self.db, "ext::auth::AuthConfig::auth_signing_key"
-        )
-        key_bytes = base64.b64encode(auth_signing_key.encode())
+    def _get_signer(self) -> _Signer:
+        return _make_signer(self._get_raw_auth_signing_key())
 
-        return jwk.JWK(kty="oct", k=key_bytes.decode())
+    def _get_auth_signing_key(self) -> jwk.JWK:
+        return self._get_signer().key
 
     def _make_state_claims(
         self,
@@ -1057,11 +1044,11 @@ class Router:
         redirect_to: str,
         redirect_to_on_signup: Optional[str],
         challenge: str,
+        now: Optional[datetime.datetime] = None,
     ) -> str:
-        signing_key = self._get_auth_signing_key()
-        expires_at = datetime.datetime.now(
-            datetime.timezone.utc
-        ) + datetime.timedelta(minutes=5)
+        if now is None:
+            now = _datetime_now(_UTC)
+        expires_at = now + datetime.timedelta(minutes=5)
 
         state_claims = {
             "iss": self.base_path,
@@ -1072,22 +1059,17 @@ class Router:
         }
         if redirect_to_on_signup:
             state_claims['redirect_to_on_signup'] = redirect_to_on_signup
-        state_token = jwt.JWT(
-            header={"alg": "HS256"},
-            claims=state_claims,
-        )
-        state_token.make_signed_token(signing_key)
-        return state_token.serialize()
+        return self._get_signer().sign(state_claims)
 
-    def _make_session_token(self, identity_id: str) -> str:
-        signing_key = self._get_auth_signing_key()
-        auth_expiration_time = util.get_config(
-            self.db,
-            "ext::auth::AuthConfig::token_time_to_live",
-            statypes.Duration,
-        )
-        expires_in = auth_expiration_time.to_timedelta()
-        expires_at = datetime.datetime.now(datetime.timezone.utc) + expires_in
+    def _make_session_token(
+        self,
+        identity_id: str,
+        now: Optional[datetime.datetime] = None,
+    ) -> str:
+        if now is None:
+            now = _datetime_now(_UTC)
+        expires_in = self._get_token_ttl()
+        expires_at = now + expires_in
 
         claims: dict[str, Any] = {
             "iss": self.base_path,
@@ -1095,24 +1077,7 @@ class Router:
         }
         if expires_in.total_seconds() != 0:
             claims["exp"] = expires_at.timestamp()
-        session_token = jwt.JWT(
-            header={"alg": "HS256"},
-            claims=claims,
-        )
-        session_token.make_signed_token(signing_key)
-        return session_token.serialize()
-
-    def _get_from_claims(self, state: str, key: str) -> str:
-        signing_key = self._get_auth_signing_key()
-        try:
-            state_token = jwt.JWT(key=signing_key, jwt=state)
-        except Exception:
-            raise errors.InvalidData("Invalid state token")
-        state_claims: dict[str, str] = json.loads(state_token.claims)
-        value = state_claims.get(key)
-        if value is None:
-            raise errors.InvalidData("Invalid state token")
-        return value
+        return self._get_signer().sign(claims)
 
     def _make_secret_token(
         self,
@@ -1121,34 +1086,57 @@ class Router:
         additional_claims: dict[str, str | int | float | bool | None]
         | None = None,
         expires_in: datetime.timedelta | None = None,
+        now: datetime.datetime | None = None,
     ) -> str:
-        signing_key = self._get_auth_signing_key()
+        if now is None:
+            now = _datetime_now(_UTC)
         expires_in = (
             datetime.timedelta(minutes=10) if expires_in is None else expires_in
         )
-        expires_at = datetime.datetime.now(datetime.timezone.utc) + expires_in
+        expires_at = now + expires_in
 
         claims: dict[str, Any] = {
             "iss": self.base_path,
             "sub": identity_id,
             "jti": secret,
-            **(additional_claims or {}),
         }
+        if additional_claims:
+            claims.update(additional_claims)
         if expires_in.total_seconds() != 0:
             claims["exp"] = expires_at.timestamp()
-        session_token = jwt.JWT(
-            header={"alg": "HS256"},
-            claims=claims,
-        )
-        session_token.make_signed_token(signing_key)
-        return session_token.serialize()
+        return self._get_signer().sign(claims)
 
     def _verify_and_extract_claims(
         self, jwtStr: str
     ) -> dict[str, str | int | float | bool]:
-        signing_key = self._get_auth_signing_key()
-        verified = jwt.JWT(key=signing_key, jwt=jwtStr)
-        return json.loads(verified.claims)
+        auth_signing_key = self._get_raw_auth_signing_key()
+        cache_key = (
+            auth_signing_key,
+            hashlib.blake2b(jwtStr.encode(), digest_size=16).digest(),
+        )
+        now = time.time()
+        try:
+            claims, deadline = _claims_cache[cache_key]
+        except KeyError:
+            pass
+        else:
+            if now < deadline:
+                return dict(claims)
+            del _claims_cache[cache_key]
+
+        claims = _decode_hs256_token(jwtStr, auth_signing_key.encode())
+        if claims is None:
+            signing_key = self._get_auth_signing_key()
+            verified = jwt.JWT(key=signing_key, jwt=jwtStr)
+            claims = json.loads(verified.claims)
+
+        ttl = _CLAIMS_CACHE_MAX_TTL
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            ttl = min(exp - now, ttl)
+        if ttl > 0:
+            _claims_cache[cache_key] = (claims, now + ttl)
+        return dict(claims)
 
     def _get_data_from_reset_token(self, token: str) -> Tuple[str, str]:
         try:
@@ -1191,31 +1179,23 @@ class Router:
         if maybe_issued_at is None:
             raise errors.InvalidData("Missing 'iat' in 'verification_token'")
 
-        return_value: Tuple[str, float, Optional[str], Optional[str]]
-        match (
+        if not isinstance(identity_id, str) or not isinstance(
+            maybe_issued_at, float
+        ):
+            raise errors.InvalidData("Invalid claims in 'verification_token'")
+
+        return (
             identity_id,
             maybe_issued_at,
             maybe_challenge,
             maybe_redirect_to,
-        ):
-            case (str(id), float(issued_at), challenge, redirect_to):
-                return_value = (id, issued_at, challenge, redirect_to)
-            case (_, _, _, _):
-                raise errors.InvalidData(
-                    "Invalid claims in 'verification_token'"
-                )
-        return return_value
+        )
 
     def _get_data_from_request(self, request: Any) -> dict[Any, Any]:
         content_type = request.content_type
         match content_type:
             case b"application/x-www-form-urlencoded":
-                return {
-                    k: v[0]
-                    for k, v in urllib.parse.parse_qs(
-                        request.body.decode('ascii')
-                    ).items()
-                }
+                return _parse_urlencoded(request.body)
             case b"application/json":
                 data = json.loads(request.body)
                 if not isinstance(data, dict):
@@ -1228,23 +1208,140 @@ class Router:
                     f"Unsupported Content-Type: {content_type}"
                 )
 
-    def _get_ui_config(self):
-        return cast(config.UIConfig, util.maybe_get_config(
-            self.db, "ext::auth::AuthConfig::ui",
+    def _get_local_client(self, provider_name: str) -> local.Client:
+        if not isinstance(provider_name, str):
+            # Let the client reject malformed input from request bodies.
+            return local.Client(db=self.db, provider_name=provider_name)
+        return self._get_cached_client(
+            ("local", id(self.db), provider_name),
+            lambda: local.Client(db=self.db, provider_name=provider_name),
+        )
+
+    def _get_oauth_client(self, provider_name: str) -> oauth.Client:
+        return self._get_cached_client(
+            ("oauth", id(self.db), provider_name, self.test_url),
+            lambda: oauth.Client(
+                db=self.db,
+                provider_name=provider_name,
+                base_url=self.test_url,
+            ),
+        )
+
+    def _get_cached_client(
+        self, key: tuple[Any, ...], factory: Callable[[], _Client]
+    ) -> _Client:
+        db = self.db
+        entry = _client_cache.get(key)
+        if (
+            entry is not None
+            and entry[0] is db.db_config
+            and entry[1] is db.user_config_spec
+            and entry[2].db is db
+        ):
+            return entry[2]
+
+        client = factory()
+        _client_cache[key] = (db.db_config, db.user_config_spec, client)
+        return client
+
+    def _get_config_snapshot(self) -> _ConfigSnapshot:
+        db = self.db
+        snapshot = _config_snapshots.get(id(db))
+        if (
+            snapshot is not None
+            and snapshot.db_config is db.db_config
+            and snapshot.user_config_spec is db.user_config_spec
+        ):
+            return snapshot
+
+        ui_config = cast(config.UIConfig, util.maybe_get_config(
+            db, "ext::auth::AuthConfig::ui",
             CompositeConfigType
         ))
-
-    def _get_password_provider(self):
-        providers = cast(list[config.ProviderConfig], util.get_config(
-            self.db,
+        providers = util.maybe_get_config(
+            db,
             "ext::auth::AuthConfig::providers",
             frozenset,
-        ))
-        password_providers = [
-            p for p in providers if (p.name == 'builtin::local_emailpassword')
-        ]
+        )
+        token_time_to_live = util.maybe_get_config(
+            db,
+            "ext::auth::AuthConfig::token_time_to_live",
+            statypes.Duration,
+        )
+        snapshot = _ConfigSnapshot(
+            db_config=db.db_config,
+            user_config_spec=db.user_config_spec,
+            ui_config=ui_config,
+            providers=providers,
+            password_provider=(
+                _find_password_provider(providers)
+                if providers is not None else None
+            ),
+            auth_signing_key=util.maybe_get_config(
+                db, "ext::auth::AuthConfig::auth_signing_key"
+            ),
+            token_time_to_live=(
+                token_time_to_live.to_timedelta()
+                if token_time_to_live is not None else None
+            ),
+            ui_render_kwargs=(
+                {
+                    "app_name": ui_config.app_name,
+                    "logo_url": ui_config.logo_url,
+                    "dark_logo_url": ui_config.dark_logo_url,
+                    "brand_color": ui_config.brand_color,
+                }
+                if ui_config is not None else {}
+            ),
+        )
+        _config_snapshots[id(db)] = snapshot
+        return snapshot
+
+    def _get_ui_config(self):
+        return self._get_config_snapshot().ui_config
+
+    def _get_ui_render_kwargs(self) -> Mapping[str, Optional[str]]:
+        """Branding arguments shared by all ui.render_*() functions."""
+        return self._get_config_snapshot().ui_render_kwargs
+
+    def _get_providers(self):
+        return self._get_config_snapshot().providers
+
+    def _get_password_provider(self):
+        snapshot = self._get_config_snapshot()
+        if snapshot.providers is None:
+            raise errors.MissingConfiguration(
+                key="ext::auth::AuthConfig::providers",
+                description="Missing configuration value",
+            )
+        return snapshot.password_provider
+
+    def _get_raw_auth_signing_key(self) -> str:
+        auth_signing_key = self._get_config_snapshot().auth_signing_key
+        if auth_signing_key is None:
+            raise errors.MissingConfiguration(
+                key="ext::auth::AuthConfig::auth_signing_key",
+                description="Missing configuration value",
+            )
+        return auth_signing_key
+
+    def _get_token_ttl(self) -> datetime.timedelta:
+        token_time_to_live = self._get_config_snapshot().token_time_to_live
+        if token_time_to_live is None:
+            raise errors.MissingConfiguration(
+                key="ext::auth::AuthConfig::token_time_to_live",
+                description="Missing configuration value",
+            )
+        return token_time_to_live
 
-        return password_providers[0] if len(password_providers) == 1 else None
+    def _get_ui_config_and_password_provider(self) -> tuple[
+        Optional[config.UIConfig],
+        Optional[config.ProviderConfig],
+    ]:
+        ui_config = self._get_config_snapshot().ui_config
+        if ui_config is None:
+            return None, None
+        return ui_config, self._get_password_provider()
 
     async def _send_verification_email(
         self,
@@ -1257,16 +1354,17 @@ class Router:
         maybe_redirect_to: str | None,
     ):
         # Generate verification token
-        issued_at = datetime.datetime.now(datetime.timezone.utc).timestamp()
+        now = _datetime_now(_UTC)
         verification_token = self._make_secret_token(
             identity_id=identity_id,
-            secret=str(uuid.uuid4()),
+            secret=secrets.token_urlsafe(16),
             additional_claims={
-                "iat": issued_at,
+                "iat": now.timestamp(),
                 "challenge": maybe_challenge,
                 "redirect_to": maybe_redirect_to,
             },
             expires_in=datetime.timedelta(seconds=0),
+            now=now,
         )
         await auth_emails.send_verification_email(
             db=self.db,
@@ -1281,16 +1379,14 @@ class Router:
     async def _try_verify_email(
         self, provider: str, issued_at: float, identity_id: str
     ) -> None:
-        current_time = datetime.datetime.now(datetime.timezone.utc)
-        issued_at_datetime = datetime.datetime.fromtimestamp(
-            issued_at, datetime.timezone.utc
-        )
-        token_age = current_time - issued_at_datetime
-        if token_age > datetime.timedelta(hours=24):
+        now = time.time()
+        if now - issued_at > _VERIFICATION_TOKEN_MAX_AGE:
             raise errors.VerificationTokenExpired()
 
-        local_client = local.Client(db=self.db, provider_name=provider)
-        updated = await local_client.verify_email(identity_id, current_time)
+        local_client = self._get_local_client(provider)
+        updated = await local_client.verify_email(
+            identity_id, datetime.datetime.fromtimestamp(now, _UTC)
+        )
         if updated is None:
             raise errors.NoIdentityFound(
                 "Could not verify email for identity"
@@ -1298,6 +1394,83 @@ class Router:
                 " in our system, or it might already be verified."
             )
 
+    _routes: ClassVar[dict[
+        tuple[str, ...],
+        Callable[['Router', Any, Any], Awaitable[None]],
+    ]] = {
+        # API routes
+        ("authorize",): handle_authorize,
+        ("callback",): handle_callback,
+        ("token",): handle_token,
+        ("register",): handle_register,
+        ("authenticate",): handle_authenticate,
+        ("verify",): handle_verify,
+        ("resend-verification-email",): handle_resend_verification_email,
+        ("send-reset-email",): handle_send_reset_email,
+        ("reset-password",): handle_reset_password,
+
+        # UI routes
+        ("ui", "signin"): handle_ui_signin,
+        ("ui", "signup"): handle_ui_signup,
+        ("ui", "forgot-password"): handle_ui_forgot_password,
+        ("ui", "reset-password"): handle_ui_reset_password,
+        ("ui", "verify"): handle_ui_verify,
+        ("ui", "resend-verification"): handle_ui_resend_verification,
+    }
+
+
+def _find_password_provider(
+    providers: frozenset[config.ProviderConfig],
+) -> Optional[config.ProviderConfig]:
+    found = None
+    for p in providers:
+        if p.name == 'builtin::local_emailpassword':
+            if found is not None:
+                # More than one password provider is a misconfiguration.
+                return None
+            found = p
+    return found
+
+
+def _decode_hs256_token(token: str, key: bytes) -> Optional[dict[str, Any]]:
+    """Verify and decode a compact HS256 token signed with *key*.
+
+    Only tokens carrying exactly the header produced by this module are
+    handled here; None is returned for anything else, and such tokens
+    should be passed to jwcrypto.  Time-based claims are checked with
+    the same leeway jwcrypto uses.
+    """
+    header, _, rest = token.partition(".")
+    if header != _JWT_HEADER_SEGMENT:
+        return None
+
+    payload, sep, signature = rest.partition(".")
+    if not sep:
+        raise jws.InvalidJWSObject("Token is not a compact JWS")
+    expected = base64.urlsafe_b64encode(
+        hmac.digest(key, f"{header}.{payload}".encode(), "sha256")
+    ).rstrip(b"=")
+    if not hmac.compare_digest(expected, signature.encode()):
+        raise jws.InvalidJWSSignature("Verification failed")
+
+    claims = json.loads(
+        base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+    )
+    if not isinstance(claims, dict):
+        raise jwt.JWTInvalidClaimFormat("Claims must be a JSON object")
+    now = time.time()
+    exp = claims.get("exp")
+    if exp is not None and exp < now - _JWT_LEEWAY:
+        raise jwt.JWTExpired("Token expired")
+    nbf = claims.get("nbf")
+    if nbf is not None and nbf > now + _JWT_LEEWAY:
+        raise jwt.JWTNotYetValid("Token not yet valid")
+    return claims
+
+
+def _utc_now_iso8601() -> str:
+    return _datetime_now(_UTC).isoformat()
+
 
 def _fail_with_error(
     *,
@@ -1316,34 +1489,86 @@ def _fail_with_error(
     response.status = status
 
 
+def _parse_urlencoded(
+    data: bytes, fields: Optional[AbstractSet[str]] = None
+) -> dict[str, str]:
+    """Parse urlencoded data into a flat dict in a single pass.
+
+    The raw bytes are split directly, and a value is only unquoted when
+    it is kept: repeated keys keep their first value, and when *fields*
+    is given, any other key is skipped.  Blank values are dropped, as
+    with parse_qs.
+    """
+    result: dict[str, str] = {}
+    for pair in data.split(b"&"):
+        raw_key, sep, raw_value = pair.partition(b"=")
+        if not sep or not raw_value:
+            continue
+        key = _unquote_plus(raw_key)
+        if key in result or (fields is not None and key not in fields):
+            continue
+        result[key] = _unquote_plus(raw_value)
+    return result
+
+
+def _unquote_plus(raw: bytes) -> str:
+    if b"%" not in raw and b"+" not in raw:
+        # Nothing to unquote, which is the common case for keys and
+        # for most values.
+        return raw.decode("utf-8", "replace")
+    return urllib.parse.unquote_to_bytes(raw.replace(b"+", b" ")).decode(
+        "utf-8", "replace"
+    )
+
+
+# Query string parameters read by any of the auth endpoints; anything
+# else (e.g. tracking parameters appended by providers) is ignored.
+_QUERY_FIELDS = frozenset({
+    "challenge",
+    "code",
+    "email",
+    "email_sent",
+    "error",
+    "error_description",
+    "provider",
+    "redirect_to",
+    "redirect_to_on_signup",
+    "reset_token",
+    "state",
+    "verification_token",
+    "verifier",
+})
+
+
+def _parse_query(raw_query: Optional[bytes]) -> dict[str, str]:
+    """Parse a raw URL query string into a flat dict.
+
+    Only the parameters listed in _QUERY_FIELDS are kept.
+    """
+    if not raw_query:
+        # Most UI pages are requested without a query string.
+        return {}
+    return _parse_urlencoded(raw_query, _QUERY_FIELDS)
+
+
 def _maybe_get_search_param(
-    query_dict: dict[str, list[str]], key: str
+    query_dict: dict[str, str], key: str
 ) -> str | None:
-    params = query_dict.get(key)
-    return params[0] if params else None
+    return query_dict.get(key)
 
 
-def _get_search_param(query_dict: dict[str, list[str]], key: str) -> str:
+def _get_search_param(query_dict: dict[str, str], key: str) -> str:
     val = _maybe_get_search_param(query_dict, key)
     if val is None:
         raise errors.InvalidData(f"Missing query parameter: {key}")
     return val
 
 
-def _maybe_get_form_field(
-    form_dict: dict[str, list[str]], key: str
-) -> str | None:
-    maybe_val = form_dict.get(key)
-    if maybe_val is None:
-        return None
-    return maybe_val[0]
-
-
 def _get_pkce_challenge(
     *,
     response,
     cookies: http.cookies.SimpleCookie,
-    query_dict: dict[str, list[str]],
+    query_dict: dict[str, str],
 ) -> str | None:
     cookie_name = 'edgedb-pkce-challenge'
     challenge: str | None = _maybe_get_search_param(query_dict, 'challenge')
@@ -1355,6 +1580,13 @@ def _get_pkce_challenge(
     return challenge
 
 
+# Characters allowed unquoted in a cookie value (see http.cookies).  Our
+# cookies hold JWTs and base64url PKCE challenges, which only use these.
+_COOKIE_VALUE_CHARS = frozenset(
+    string.ascii_letters + string.digits + "!#$%&'*+-.^_`|~:"
+)
+
+
 def _set_cookie(
     response: Any,
     name: str,
@@ -1363,25 +1595,70 @@ def _set_cookie(
     secure: bool = True,
     same_site: str = "Strict",
 ):
-    val: http.cookies.Morsel = http.cookies.SimpleCookie({name: value})[name]
-    val["httponly"] = http_only
-    val["secure"] = secure
-    val["samesite"] = same_site
-    response.custom_headers["Set-Cookie"] = val.OutputString()
-
+    if not set(value) <= _COOKIE_VALUE_CHARS:
+        # Needs quoting, leave that to http.cookies.
+        val: http.cookies.Morsel = (
+            http.cookies.SimpleCookie({name: value})[name]
+        )
+        val["httponly"] = http_only
+        val["secure"] = secure
+        val["samesite"] = same_site
+        response.custom_headers["Set-Cookie"] = val.OutputString()
+        return
+
+    # Same attributes, in the same order, as Morsel.OutputString().
+    parts = [f"{name}={value}"]
+    if http_only:
+        parts.append("HttpOnly")
+    if same_site:
+        parts.append(f"SameSite={same_site}")
+    if secure:
+        parts.append("Secure")
+    response.custom_headers["Set-Cookie"] = "; ".join(parts)
+
+
+def _with_appended_qs(
+    url: str, query: Mapping[str, str | list[str]]
+) -> str:
+    """Return *url* with the *query* params added to its query string.
+
+    Params in *query* replace any existing params of the same name.
+    Redirect URLs rarely carry any of the params we add, so in the
+    common case the encoded params are appended to the URL as is, and
+    the URL is only fully parsed and rebuilt when a key may clash or
+    there is a fragment to keep at the end.
+    """
+    if "#" not in url:
+        encoded = urllib.parse.urlencode(query, doseq=True)
+        if "?" not in url:
+            return f"{url}?{encoded}"
+        if not any(
+            f"?{key}=" in url or f"&{key}=" in url
+            for key in map(urllib.parse.quote_plus, query)
+        ):
+            sep = "" if url.endswith(("?", "&")) else "&"
+            return f"{url}{sep}{encoded}"
 
-def _with_appended_qs(url: str, query: dict[str, list[str]]) -> str:
     url_parts = list(urllib.parse.urlparse(url))
-    existing_query = urllib.parse.parse_qs(url_parts[4])
+    existing_query: dict[str, Any] = urllib.parse.parse_qs(url_parts[4])
     existing_query.update(query)
 
     url_parts[4] = urllib.parse.urlencode(existing_query, doseq=True)
     return urllib.parse.urlunparse(url_parts)
 
 
+def _redirect_error(
+    response: Any, redirect_to: str, ex: Exception, **params: str
+) -> None:
+    response.status = http.HTTPStatus.FOUND
+    response.custom_headers["Location"] = _with_appended_qs(
+        redirect_to, {"error": str(ex), **params}
+    )
+
+
 def _check_keyset(candidate: dict[str, Any], keyset: set[str]):
-    missing_fields = [field for field in keyset if field not in candidate]
+    missing_fields = keyset - candidate.keys()
     if missing_fields:
         raise errors.InvalidData(
-            "Missing required fields: " ", ".join(missing_fields)
+            "Missing required fields: " + ", ".join(sorted(missing_fields))
         )
@@ -66,17 +66,37 @@ async def create(db, challenge: str):
     )
 
 
-async def link_identity_challenge(db, identity_id: str, challenge: str) -> str:
+async def link_identity_challenge_with_tokens(
+    db,
+    identity_id: str,
+    challenge: str,
+    auth_token: str | None,
+    refresh_token: str | None,
+) -> str:
     r = await execute.parse_execute_json(
         db,
         """
+        with
+            new_auth_token := <optional str>$auth_token,
+            new_refresh_token := <optional str>$refresh_token,
+            has_tokens := exists new_auth_token or exists new_refresh_token,
         update ext::auth::PKCEChallenge
         filter .challenge = <str>$challenge
-        set { identity := <ext::auth::Identity><uuid>$identity_id }
+        set {
+            identity := <ext::auth::Identity><uuid>$identity_id,
+            auth_token := (
+                new_auth_token if has_tokens else .auth_token
+            ),
+            refresh_token := (
+                new_refresh_token if has_tokens else .refresh_token
+            ),
+        }
         """,
         variables={
             "challenge": challenge,
             "identity_id": identity_id,
+            "auth_token": auth_token,
+            "refresh_token": refresh_token,
         },
         cached_globally=True,
     )
@@ -87,23 +107,24 @@ async def link_identity_challenge(db, identity_id: str, challenge: str) -> str:
     return result_json[0]["id"]
 
 
-async def add_provider_tokens(
-    db, id: str, auth_token: str | None, refresh_token: str | None
-):
+async def create_and_link(db, identity_id: str, challenge: str) -> str:
     r = await execute.parse_execute_json(
         db,
         """
-        update ext::auth::PKCEChallenge
-        filter .id = <uuid>$id
-        set {
-            auth_token := <optional str>$auth_token,
-            refresh_token := <optional str>$refresh_token,
-        }
+        with
+            identity := <ext::auth::Identity><uuid>$identity_id,
+        insert ext::auth::PKCEChallenge {
+            challenge := <str>$challenge,
+            identity := identity,
+        } unless conflict on .challenge
+        else (
+            update ext::auth::PKCEChallenge
+            set { identity := identity }
+        )
         """,
         variables={
-            "id": id,
-            "auth_token": auth_token,
-            "refresh_token": refresh_token,
+            "challenge": challenge,
+            "identity_id": identity_id,
         },
         cached_globally=True,
     )
@@ -22,6 +22,7 @@ import asyncio
 import email
 import os
 import pickle
+import time
 
 import aiosmtplib
 
@@ -33,6 +34,16 @@ from . import util
 
 _semaphore: asyncio.BoundedSemaphore | None = None
 
+# Idle SMTP connections, keyed by connection parameters.  The number of
+# connections in use at any time is bounded by _semaphore, and so is the
+# number of idle ones.  Connections idle for longer than _IDLE_TIMEOUT
+# seconds are closed.
+_IDLE_TIMEOUT = 60.0
+_idle_connections: dict[
+    tuple[Any, ...], list[tuple[aiosmtplib.SMTP, float]]
+] = {}
+_idle_reaper: asyncio.TimerHandle | None = None
+
 
 async def send_email(
     db: Any,
@@ -124,9 +135,6 @@ async def send_email(
     async for iteration in rloop:
         async with iteration:
             async with _semaphore:
-                # Currently we are not reusing SMTP connections, but ideally we
-                # should replace this with a pool of connections, and drop idle
-                # connections after configured time.
                 args = dict(
                     message=message,
                     sender=sender,
@@ -149,4 +157,86 @@ async def send_email(
                     with open(test_file, "wb") as f:
                         pickle.dump(args, f)
                 else:
-                    await aiosmtplib.send(**args)  # type: ignore
+                    await _send_pooled(**args)  # type: ignore
+
+
+async def _send_pooled(
+    message: Union[
+        email.message.EmailMessage,
+        email.message.Message,
+        str,
+        bytes,
+    ],
+    *,
+    sender: Optional[str],
+    recipients: Optional[Union[str, Sequence[str]]],
+    **smtp_args: Any,
+) -> None:
+    key = tuple(sorted(smtp_args.items()))
+    conn = await _acquire_connection(key, smtp_args)
+    try:
+        if isinstance(message, (str, bytes)):
+            assert sender is not None and recipients is not None
+            await conn.sendmail(sender, recipients, message)
+        else:
+            await conn.send_message(
+                message, sender=sender, recipients=recipients
+            )
+    except BaseException:
+        conn.close()
+        raise
+    else:
+        _release_connection(key, conn)
+
+
+async def _acquire_connection(
+    key: tuple[Any, ...], smtp_args: dict[str, Any]
+) -> aiosmtplib.SMTP:
+    idle = _idle_connections.get(key)
+    now = time.monotonic()
+    while idle:
+        conn, released_at = idle.pop()
+        if now - released_at >= _IDLE_TIMEOUT or not conn.is_connected:
+            conn.close()
+            continue
+        try:
+            await conn.noop()
+        except aiosmtplib.SMTPException:
+            conn.close()
+        else:
+            return conn
+
+    conn = aiosmtplib.SMTP(**smtp_args)
+    await conn.connect()
+    return conn
+
+
+def _release_connection(key: tuple[Any, ...], conn: aiosmtplib.SMTP) -> None:
+    global _idle_reaper
+    _idle_connections.setdefault(key, []).append((conn, time.monotonic()))
+    if _idle_reaper is None:
+        _idle_reaper = asyncio.get_running_loop().call_later(
+            _IDLE_TIMEOUT, _close_idle_connections
+        )
+
+
+def _close_idle_connections() -> None:
+    global _idle_reaper
+    _idle_reaper = None
+    now = time.monotonic()
+    for key, idle in list(_idle_connections.items()):
+        alive = []
+        for conn, released_at in idle:
+            if now - released_at >= _IDLE_TIMEOUT:
+                conn.close()
+            else:
+                alive.append((conn, released_at))
+        if alive:
+            _idle_connections[key] = alive
+        else:
+            del _idle_connections[key]
+
+    if _idle_connections:
+        _idle_reaper = asyncio.get_running_loop().call_later(
+            _IDLE_TIMEOUT, _close_idle_connections
+        )
@@ -33,6 +33,8 @@ import time
 import immutables
 
 from edb import errors
+from edb.common import lru
+from edb.common import prometheus
 from edb.common import retryloop
 from edb.common import taskgroup
 
@@ -55,6 +57,27 @@ if TYPE_CHECKING:
 
 
 logger = logging.getLogger("edb.server")
+_uint32_packer = struct.Struct("!L").pack
+
+
+def _counts_background_errors(
+    meth: Callable[..., None]
+) -> Callable[..., None]:
+    """Count exceptions escaping a Tenant callback in background_errors.
+
+    The method name is used as the source label of the metric.
+    """
+    source = meth.__name__
+
+    @functools.wraps(meth)
+    def wrapper(self: Tenant, *args: Any, **kwargs: Any) -> None:
+        try:
+            meth(self, *args, **kwargs)
+        except Exception:
+            metrics.background_errors.inc(1.0, self._instance_name, source)
+            raise
+
+    return wrapper
 
 
 class RoleDescriptor(TypedDict):
@@ -66,6 +89,7 @@ class RoleDescriptor(TypedDict):
 class Tenant(ha_base.ClusterProtocol):
     _server: edbserver.BaseServer
     _cluster: pgcluster.BaseCluster
+    _backend_runtime_params: pgparams.BackendRuntimeParams
     _tenant_id: str
     _instance_name: str
     _instance_data: Mapping[str, str]
@@ -88,18 +112,36 @@ class Tenant(ha_base.ClusterProtocol):
     _pg_pool: connpool.Pool
     _pg_unavailable_msg: str | None
 
+    # Backend connection metrics with the tenant label bound up front.
+    _m_backend_conn_errors: prometheus.BoundLabeledCounter
+    _m_backend_conn_latency: prometheus.BoundLabeledHistogram
+    _m_backend_conns_total: prometheus.BoundLabeledCounter
+    _m_backend_conns_current: prometheus.BoundLabeledGauge
+
     _ha_master_serial: int
     _backend_adaptive_ha: adaptive_ha.AdaptiveHASupport | None
     _readiness_state_file: str | None
     _readiness: srvargs.ReadinessState
     _readiness_reason: str
 
-    # A set of databases that should not accept new connections.
+    # A set of databases that should not accept new connections.  The
+    # template database is always in it.
     _block_new_connections: set[str]
+    # Pending checks that no one is connected to a database, so that
+    # concurrent callers can share a single polling loop.
+    _db_not_connected_waiters: dict[str, asyncio.Future[bool]]
+    # Databases with an introspection task in flight, mapped to the source
+    # of a follow-up introspection request received meanwhile, if any.
+    _introspect_db_requests: dict[str, str | None]
     _report_config_data: dict[defines.ProtocolVersion, bytes]
 
     _roles: Mapping[str, RoleDescriptor]
     _sys_auth: Tuple[Any, ...]
+    # _sys_auth entries applicable to each transport, in priority order.
+    _sys_auth_by_transport: dict[srvargs.ServerConnTransport, Tuple[Any, ...]]
+    # Resolved auth methods by (user, transport), reset along with
+    # _sys_auth.  Bounded, since the user names come from the clients.
+    _auth_method_cache: lru.LRUMapping
     _jwt_sub_allowlist_file: pathlib.Path | None
     _jwt_sub_allowlist: frozenset[str] | None
     _jwt_revocation_list_file: pathlib.Path | None
@@ -117,9 +159,20 @@ class Tenant(ha_base.ClusterProtocol):
         jwt_revocation_list_file: pathlib.Path | None = None,
     ):
         self._cluster = cluster
-        self._tenant_id = self.get_backend_runtime_params().tenant_id
+        self._backend_runtime_params = cluster.get_runtime_params()
+        self._tenant_id = self._backend_runtime_params.tenant_id
         self._instance_name = instance_name
         self._instance_data = immutables.Map()
+        self._m_backend_conn_errors = (
+            metrics.backend_connection_establishment_errors.labels(
+                instance_name))
+        self._m_backend_conn_latency = (
+            metrics.backend_connection_establishment_latency.labels(
+                instance_name))
+        self._m_backend_conns_total = (
+            metrics.total_backend_connections.labels(instance_name))
+        self._m_backend_conns_current = (
+            metrics.current_backend_connections.labels(instance_name))
         self._initing = True
         self._running = False
         self._accepting_connections = False
@@ -158,7 +211,9 @@ class Tenant(ha_base.ClusterProtocol):
             max_capacity=max_backend_connections - 1,
         )
         self._pg_unavailable_msg = None
-        self._block_new_connections = set()
+        self._block_new_connections = {defines.EDGEDB_TEMPLATE_DB}
+        self._db_not_connected_waiters = {}
+        self._introspect_db_requests = {}
         self._report_config_data = {}
 
         # DB state will be initialized in init().
@@ -166,6 +221,8 @@ class Tenant(ha_base.ClusterProtocol):
 
         self._roles = immutables.Map()
         self._sys_auth = tuple()
+        self._sys_auth_by_transport = {}
+        self._auth_method_cache = lru.LRUMapping(maxsize=1024)
         self._jwt_sub_allowlist_file = jwt_sub_allowlist_file
         self._jwt_sub_allowlist = None
         self._jwt_revocation_list_file = jwt_revocation_list_file
@@ -228,9 +285,8 @@ class Tenant(ha_base.ClusterProtocol):
     def get_pgaddr(self) -> Dict[str, Any]:
         return self._cluster.get_connection_spec()
 
-    @functools.lru_cache
     def get_backend_runtime_params(self) -> pgparams.BackendRuntimeParams:
-        return self._cluster.get_runtime_params()
+        return self._backend_runtime_params
 
     def get_instance_name(self) -> str:
         return self._instance_name
@@ -294,7 +350,7 @@ class Tenant(ha_base.ClusterProtocol):
         role_query = self._server.get_sys_query("roles")
         json_data = await syscon.sql_fetch_val(role_query, use_prep_stmt=True)
         roles = json.loads(json_data)
-        self._roles = immutables.Map([(r["name"], r) for r in roles])
+        self._roles = immutables.Map((r["name"], r) for r in roles)
 
     async def init_sys_pgcon(self) -> None:
         self._sys_pgcon_waiter = asyncio.Lock()
@@ -398,13 +454,13 @@ class Tenant(ha_base.ClusterProtocol):
         if self._accept_new_tasks and self._task_group is not None:
             if interruptable:
                 rv = self.__loop.create_task(coro)
+                # Keep a strong reference of the created Task; tasks in
+                # the task group are already referenced by the group.
+                self._tasks.add(rv)
+                rv.add_done_callback(self._tasks.discard)
             else:
                 rv = self._task_group.create_task(coro)
 
-            # Keep a strong reference of the created Task
-            self._tasks.add(rv)
-            rv.add_done_callback(self._tasks.discard)
-
             return rv
         else:
             # Hint: add `if tenant.accept_new_tasks` before `.create_task()`
@@ -429,41 +485,39 @@ class Tenant(ha_base.ClusterProtocol):
 
     async def _pg_connect(self, dbname: str) -> pgcon.PGConnection:
         ha_serial = self._ha_master_serial
-        if self.get_backend_runtime_params().has_create_database:
+        runtime_params = self._backend_runtime_params
+        if runtime_params.has_create_database:
             pg_dbname = self.get_pg_dbname(dbname)
         else:
             pg_dbname = self.get_pg_dbname(defines.EDGEDB_SUPERUSER_DB)
         started_at = time.monotonic()
         try:
             rv = await pgcon.connect(
-                self.get_pgaddr(), pg_dbname, self.get_backend_runtime_params()
+                self.get_pgaddr(), pg_dbname, runtime_params
             )
             if self._server.stmt_cache_size is not None:
                 rv.set_stmt_cache_size(self._server.stmt_cache_size)
         except Exception:
-            metrics.backend_connection_establishment_errors.inc(
-                1.0, self._instance_name
-            )
+            self._m_backend_conn_errors.inc()
             raise
         finally:
-            metrics.backend_connection_establishment_latency.observe(
-                time.monotonic() - started_at, self._instance_name
-            )
+            self._m_backend_conn_latency.observe(
+                time.monotonic() - started_at)
         if ha_serial == self._ha_master_serial:
             rv.set_tenant(self)
             if self._backend_adaptive_ha is not None:
                 self._backend_adaptive_ha.on_pgcon_made(
                     dbname == defines.EDGEDB_SYSTEM_DB
                 )
-            metrics.total_backend_connections.inc(1.0, self._instance_name)
-            metrics.current_backend_connections.inc(1.0, self._instance_name)
+            self._m_backend_conns_total.inc()
+            self._m_backend_conns_current.inc()
             return rv
         else:
             rv.terminate()
             raise ConnectionError("connected to outdated Postgres master")
 
     async def _pg_disconnect(self, conn: pgcon.PGConnection) -> None:
-        metrics.current_backend_connections.dec(1.0, self._instance_name)
+        self._m_backend_conns_current.dec()
         conn.terminate()
 
     @contextlib.asynccontextmanager
@@ -484,98 +538,88 @@ class Tenant(ha_base.ClusterProtocol):
         if not self._initing and not self._running:
             raise RuntimeError("EdgeDB server is not running.")
 
-        await self._sys_pgcon_waiter.acquire()
-
-        if not self._initing and not self._running:
-            self._sys_pgcon_waiter.release()
-            raise RuntimeError("EdgeDB server is not running.")
+        # The system connection can only run one query at a time, so the
+        # lock is needed even when the connection is healthy; it's only
+        # held for as long as the caller uses the connection.
+        waiter = self._sys_pgcon_waiter
+        await waiter.acquire()
+        try:
+            if not self._initing and not self._running:
+                # The tenant was stopped while we were waiting
+                raise RuntimeError("EdgeDB server is not running.")
 
-        if self.__sys_pgcon is None or not self.__sys_pgcon.is_healthy():
-            conn, self.__sys_pgcon = self.__sys_pgcon, None
-            if conn is not None:
-                self._sys_pgcon_ready_evt.clear()
-                conn.abort()
-            # We depend on the reconnect on connection_lost() of __sys_pgcon
-            await self._sys_pgcon_ready_evt.wait()
-            if self.__sys_pgcon is None:
-                self._sys_pgcon_waiter.release()
-                raise RuntimeError("Cannot acquire pgcon to the system DB.")
+            conn = self.__sys_pgcon
+            if conn is None or not conn.is_healthy():
+                self.__sys_pgcon = None
+                if conn is not None:
+                    self._sys_pgcon_ready_evt.clear()
+                    conn.abort()
+                # We depend on the reconnect on connection_lost() of
+                # __sys_pgcon
+                await self._sys_pgcon_ready_evt.wait()
+                conn = self.__sys_pgcon
+                if conn is None:
+                    raise RuntimeError(
+                        "Cannot acquire pgcon to the system DB."
+                    )
 
-        try:
-            yield self.__sys_pgcon
+            yield conn
         finally:
-            self._sys_pgcon_waiter.release()
+            waiter.release()
 
     def set_stmt_cache_size(self, size: int) -> None:
         for conn in self._pg_pool.iterate_connections():
             conn.set_stmt_cache_size(size)
 
+    @_counts_background_errors
     def on_sys_pgcon_parameter_status_updated(
         self,
         name: str,
         value: str,
     ) -> None:
-        try:
-            if name == "in_hot_standby" and value == "on":
-                # It is a strong evidence of failover if the sys_pgcon receives
-                # a notification that in_hot_standby is turned on.
-                self.on_sys_pgcon_failover_signal()
-        except Exception:
-            metrics.background_errors.inc(
-                1.0,
-                self._instance_name,
-                "on_sys_pgcon_parameter_status_updated"
-            )
-            raise
+        if name == "in_hot_standby" and value == "on":
+            # It is a strong evidence of failover if the sys_pgcon receives
+            # a notification that in_hot_standby is turned on.
+            self.on_sys_pgcon_failover_signal()
 
+    @_counts_background_errors
     def on_sys_pgcon_failover_signal(self) -> None:
         if not self._running:
             return
-        try:
-            if self._backend_adaptive_ha is not None:
-                # Switch to FAILOVER if adaptive HA is enabled
-                self._backend_adaptive_ha.set_state_failover()
-            elif getattr(self._cluster, "_ha_backend", None) is None:
-                # If the server is not using an HA backend, nor has enabled the
-                # adaptive HA monitoring, we still try to "switch over" by
-                # disconnecting all pgcons if failover signal is received,
-                # allowing reconnection to happen sooner.
-                self.on_switch_over()
-            # Else, the HA backend should take care of calling on_switch_over()
-        except Exception:
-            metrics.background_errors.inc(
-                1.0, self._instance_name, "on_sys_pgcon_failover_signal"
-            )
-            raise
-
+        if self._backend_adaptive_ha is not None:
+            # Switch to FAILOVER if adaptive HA is enabled
+            self._backend_adaptive_ha.set_state_failover()
+        elif getattr(self._cluster, "_ha_backend", None) is None:
+            # If the server is not using an HA backend, nor has enabled the
+            # adaptive HA monitoring, we still try to "switch over" by
+            # disconnecting all pgcons if failover signal is received,
+            # allowing reconnection to happen sooner.
+            self.on_switch_over()
+        # Else, the HA backend should take care of calling on_switch_over()
+
+    @_counts_background_errors
     def on_sys_pgcon_connection_lost(self, exc: Exception | None) -> None:
-        try:
-            if not self._running:
-                # The tenant is shutting down, release all events so that
-                # the waiters if any could continue and exit
-                self._sys_pgcon_ready_evt.set()
-                self._sys_pgcon_reconnect_evt.set()
-                return
+        if not self._running:
+            # The tenant is shutting down, release all events so that
+            # the waiters if any could continue and exit
+            self._sys_pgcon_ready_evt.set()
+            self._sys_pgcon_reconnect_evt.set()
+            return
 
-            logger.error(
-                "Connection to the system database is "
-                + ("closed." if exc is None else f"broken! Reason: {exc}")
-            )
-            self.set_pg_unavailable_msg(
-                "Connection is lost, please check server log for the reason."
-            )
-            self.__sys_pgcon = None
-            self._sys_pgcon_ready_evt.clear()
-            if self._accept_new_tasks:
-                self.create_task(
-                    self._reconnect_sys_pgcon(), interruptable=True
-                )
-            self.on_pgcon_broken(True)
-        except Exception:
-            metrics.background_errors.inc(
-                1.0, self._instance_name, "on_sys_pgcon_connection_lost"
+        logger.error(
+            "Connection to the system database is "
+            + ("closed." if exc is None else f"broken! Reason: {exc}")
+        )
+        self.set_pg_unavailable_msg(
+            "Connection is lost, please check server log for the reason."
+        )
+        self.__sys_pgcon = None
+        self._sys_pgcon_ready_evt.clear()
+        if self._accept_new_tasks:
+            self.create_task(
+                self._reconnect_sys_pgcon(), interruptable=True
             )
-            raise
+        self.on_pgcon_broken(True)
 
     async def _reconnect_sys_pgcon(self) -> None:
         try:
@@ -633,24 +677,15 @@ class Tenant(ha_base.ClusterProtocol):
         finally:
             self._sys_pgcon_ready_evt.set()
 
+    @_counts_background_errors
     def on_pgcon_broken(self, is_sys_pgcon: bool = False) -> None:
-        try:
-            if self._backend_adaptive_ha:
-                self._backend_adaptive_ha.on_pgcon_broken(is_sys_pgcon)
-        except Exception:
-            metrics.background_errors.inc(
-                1.0, self._instance_name, "on_pgcon_broken"
-            )
-            raise
+        if self._backend_adaptive_ha:
+            self._backend_adaptive_ha.on_pgcon_broken(is_sys_pgcon)
 
+    @_counts_background_errors
     def on_pgcon_lost(self) -> None:
-        try:
-            if self._backend_adaptive_ha:
-                self._backend_adaptive_ha.on_pgcon_lost()
-        except Exception:
-            metrics.background_errors.inc(
-                1.0, self._instance_name, "on_pgcon_lost")
-            raise
+        if self._backend_adaptive_ha:
+            self._backend_adaptive_ha.on_pgcon_lost()
 
     def set_pg_unavailable_msg(self, msg: str | None) -> None:
         if msg is None or self._pg_unavailable_msg is None:
@@ -663,7 +698,12 @@ class Tenant(ha_base.ClusterProtocol):
             )
 
         for _ in range(self._pg_pool.max_capacity):
-            conn = await self._pg_pool.acquire(dbname)
+            # Idle connections that are already broken are discarded by the
+            # pool itself; the check below only catches connections that
+            # broke while this task was waiting for one.
+            conn = await self._pg_pool.acquire_healthy(
+                dbname, pgcon.PGConnection.is_healthy
+            )
             if conn.is_healthy():
                 return conn
             else:
@@ -697,13 +737,11 @@ class Tenant(ha_base.ClusterProtocol):
             raise
 
     def allow_database_connections(self, dbname: str) -> None:
-        self._block_new_connections.discard(dbname)
+        if dbname != defines.EDGEDB_TEMPLATE_DB:
+            self._block_new_connections.discard(dbname)
 
     def is_database_connectable(self, dbname: str) -> bool:
-        return (
-            dbname != defines.EDGEDB_TEMPLATE_DB
-            and dbname not in self._block_new_connections
-        )
+        return dbname not in self._block_new_connections
 
     async def ensure_database_not_connected(self, dbname: str) -> None:
         if self._dbindex and self._dbindex.count_connections(dbname):
@@ -724,6 +762,22 @@ class Tenant(ha_base.ClusterProtocol):
                 "ensure-database-not-used", dbname=dbname
             )
 
+            await self._wait_database_not_connected(dbname)
+
+    async def _wait_database_not_connected(self, dbname: str) -> None:
+        while (
+            waiter := self._db_not_connected_waiters.get(dbname)
+        ) is not None:
+            # Someone is already polling Postgres for this database,
+            # share their result instead of polling concurrently.
+            # A False result means the poller was cancelled, in which
+            # case one of the remaining callers takes over.
+            if await asyncio.shield(waiter):
+                return
+
+        waiter = self.__loop.create_future()
+        self._db_not_connected_waiters[dbname] = waiter
+        try:
             rloop = retryloop.RetryLoop(
                 backoff=retryloop.exp_backoff(),
                 timeout=10.0,
@@ -733,6 +787,18 @@ class Tenant(ha_base.ClusterProtocol):
             async for iteration in rloop:
                 async with iteration:
                     await self._pg_ensure_database_not_connected(dbname)
+        except asyncio.CancelledError:
+            waiter.set_result(False)
+            raise
+        except Exception as ex:
+            waiter.set_exception(ex)
+            # Don't complain about the exception if nobody else waited.
+            waiter.exception()
+            raise
+        else:
+            waiter.set_result(True)
+        finally:
+            del self._db_not_connected_waiters[dbname]
 
     async def _pg_ensure_database_not_connected(self, dbname: str) -> None:
         async with self.use_sys_pgcon() as pgcon:
@@ -775,17 +841,12 @@ class Tenant(ha_base.ClusterProtocol):
     async def _introspect_extensions(
         self, conn: pgcon.PGConnection
     ) -> set[str]:
-        extension_names_json = await conn.sql_fetch_val(
+        extension_names = await conn.sql_fetch_col(
             b"""
-                SELECT json_agg(name) FROM edgedb."_SchemaExtension";
+                SELECT name FROM edgedb."_SchemaExtension";
             """,
         )
-        if extension_names_json:
-            extensions = set(json.loads(extension_names_json))
-        else:
-            extensions = set()
-
-        return extensions
+        return {name.decode("utf-8") for name in extension_names}
 
     async def introspect_db(self, dbname: str) -> None:
         """Use this method to (re-)introspect a DB.
@@ -813,39 +874,38 @@ class Tenant(ha_base.ClusterProtocol):
                 await self._server.introspect_user_schema_json(conn)
             )
 
-            reflection_cache_json = await conn.sql_fetch_val(
+            # Fetch the reflection cache and the backend type ids in a
+            # single round-trip.
+            ((reflection_cache_json, backend_ids_json),) = await conn.sql_fetch(
                 b"""
-                    SELECT json_agg(o.c)
-                    FROM (
+                SELECT
+                    (
                         SELECT
-                            json_build_object(
-                                'eql_hash', t.eql_hash,
-                                'argnames', array_to_json(t.argnames)
-                            ) AS c
+                            coalesce(
+                                json_agg(
+                                    json_build_array(t.eql_hash, t.argnames)
+                                ),
+                                '[]'
+                            )::text
                         FROM
                             ROWS FROM(edgedb._get_cached_reflection())
                                 AS t(eql_hash text, argnames text[])
-                    ) AS o;
+                    ),
+                    (
+                        SELECT
+                            json_object_agg(
+                                "id"::text,
+                                "backend_id"
+                            )::text
+                        FROM
+                            edgedb."_SchemaType"
+                    );
                 """,
             )
 
             reflection_cache = immutables.Map(
-                {
-                    r["eql_hash"]: tuple(r["argnames"])
-                    for r in json.loads(reflection_cache_json)
-                }
-            )
-
-            backend_ids_json = await conn.sql_fetch_val(
-                b"""
-                SELECT
-                    json_object_agg(
-                        "id"::text,
-                        "backend_id"
-                    )::text
-                FROM
-                    edgedb."_SchemaType"
-                """,
+                (eql_hash, tuple(argnames))
+                for eql_hash, argnames in json.loads(reflection_cache_json)
             )
             backend_ids = json.loads(backend_ids_json)
 
@@ -880,6 +940,11 @@ class Tenant(ha_base.ClusterProtocol):
         Otherwise, we won't know to accept connections for graphql or
         http, for example, until a native connection is made.
         """
+        assert self._dbindex is not None
+        if self._dbindex.has_db(dbname):
+            # Already introspected, no need to tie up a connection.
+            return
+
         logger.info("introspecting extensions for database '%s'", dbname)
 
         conn = await self._acquire_intro_pgcon(dbname)
@@ -887,7 +952,6 @@ class Tenant(ha_base.ClusterProtocol):
             return
 
         try:
-            assert self._dbindex is not None
             if not self._dbindex.has_db(dbname):
                 extensions = await self._introspect_extensions(conn)
                 # Re-check in case we have a concurrent introspection task.
@@ -923,16 +987,20 @@ class Tenant(ha_base.ClusterProtocol):
                     use_prep_stmt=True,
                 )
 
-                for (
-                    protocol_ver,
-                    typedesc,
-                ) in self._server.get_report_config_typedesc().items():
-                    self._report_config_data[protocol_ver] = (
-                        struct.pack("!L", len(typedesc))
-                        + typedesc
-                        + struct.pack("!L", len(data))
-                        + data
+                # The data part is the same for all protocol versions.
+                data_part = _uint32_packer(len(data)) + data
+
+                # Build a new mapping and swap it in, so that it only ever
+                # holds entries for the current set of protocol versions.
+                self._report_config_data = {
+                    protocol_ver: b"".join(
+                        (_uint32_packer(len(typedesc)), typedesc, data_part)
                     )
+                    for (
+                        protocol_ver,
+                        typedesc,
+                    ) in self._server.get_report_config_typedesc().items()
+                }
             except Exception:
                 metrics.background_errors.inc(
                     1.0, self._instance_name, "load_reported_config"
@@ -969,22 +1037,42 @@ class Tenant(ha_base.ClusterProtocol):
         cfg = self._dbindex.get_sys_config()
         auth = self._server.config_lookup("auth", cfg) or ()
         self._sys_auth = tuple(sorted(auth, key=lambda a: a.priority))
+        self._sys_auth_by_transport = {
+            transport: tuple(
+                auth
+                for auth in self._sys_auth
+                if not auth.method.transports
+                or transport in auth.method.transports
+            )
+            for transport in srvargs.ServerConnTransport
+        }
+        self._auth_method_cache = lru.LRUMapping(maxsize=1024)
 
     async def get_auth_method(
         self,
         user: str,
         transport: srvargs.ServerConnTransport,
     ) -> Any:
-        authlist = self._sys_auth
+        key = (user, transport)
+        try:
+            return self._auth_method_cache[key]
+        except KeyError:
+            pass
+
+        method = self._resolve_auth_method(user, transport)
+        self._auth_method_cache[key] = method
+        return method
+
+    def _resolve_auth_method(
+        self,
+        user: str,
+        transport: srvargs.ServerConnTransport,
+    ) -> Any:
+        authlist = self._sys_auth_by_transport.get(transport)
 
         if authlist:
             for auth in authlist:
-                match = (user in auth.user or "*" in auth.user) and (
-                    not auth.method.transports
-                    or transport in auth.method.transports
-                )
-
-                if match:
+                if user in auth.user or "*" in auth.user:
                     return auth.method
 
         default_method = self._server.get_default_auth_method(transport)
@@ -1137,17 +1225,12 @@ class Tenant(ha_base.ClusterProtocol):
 
         await self.ensure_database_not_connected(dbname)
 
+    @_counts_background_errors
     def on_after_drop_db(self, dbname: str) -> None:
-        try:
-            assert self._dbindex is not None
-            if self._dbindex.has_db(dbname):
-                self._dbindex.unregister_db(dbname)
-            self._block_new_connections.discard(dbname)
-        except Exception:
-            metrics.background_errors.inc(
-                1.0, self._instance_name, "on_after_drop_db"
-            )
-            raise
+        assert self._dbindex is not None
+        if self._dbindex.has_db(dbname):
+            self._dbindex.unregister_db(dbname)
+        self.allow_database_connections(dbname)
 
     async def cancel_pgcon_operation(self, con: pgcon.PGConnection) -> bool:
         async with self.use_sys_pgcon() as syscon:
@@ -1226,16 +1309,39 @@ class Tenant(ha_base.ClusterProtocol):
 
         # Triggered by a postgres notification event 'schema-changes'
         # on the __edgedb_sysevent__ channel
+        self._schedule_introspect_db(dbname, "on_remote_ddl")
+
+    def _schedule_introspect_db(self, dbname: str, source: str) -> None:
+        # Only run one introspection of a database at a time.  If another
+        # request comes in while one is in flight, the running one may
+        # have already read the old state, so remember to run exactly one
+        # more after it; any further requests are folded into that one.
+        if dbname in self._introspect_db_requests:
+            self._introspect_db_requests[dbname] = source
+            return
+        self._introspect_db_requests[dbname] = None
+
         async def task():
             try:
                 await self.introspect_db(dbname)
             except Exception:
                 metrics.background_errors.inc(
-                    1.0, self._instance_name, "on_remote_ddl"
+                    1.0, self._instance_name, source
                 )
                 raise
 
-        self.create_task(task(), interruptable=True)
+        def on_done(_: asyncio.Task) -> None:
+            # Runs even if the task is cancelled before it gets to start.
+            rerun_source = self._introspect_db_requests.pop(dbname)
+            if rerun_source is not None and self._accept_new_tasks:
+                self._schedule_introspect_db(dbname, rerun_source)
+
+        try:
+            introspect_task = self.create_task(task(), interruptable=True)
+        except BaseException:
+            del self._introspect_db_requests[dbname]
+            raise
+        introspect_task.add_done_callback(on_done)
 
     def on_remote_database_changes(self) -> None:
         if not self._accept_new_tasks:
@@ -1249,15 +1355,10 @@ class Tenant(ha_base.ClusterProtocol):
 
             tg = taskgroup.TaskGroup(name="new database introspection")
             async with tg as g:
-                for dbname in dbnames:
-                    if not self._dbindex.has_db(dbname):
-                        g.create_task(self._early_introspect_db(dbname))
+                for dbname in dbnames - self._dbindex.get_db_names():
+                    g.create_task(self._early_introspect_db(dbname))
 
-            dropped = []
-            for db in self._dbindex.iter_dbs():
-                if db.name not in dbnames:
-                    dropped.append(db.name)
-            for dbname in dropped:
+            for dbname in self._dbindex.get_db_names() - dbnames:
                 self.on_after_drop_db(dbname)
 
         self.create_task(task(), interruptable=True)
@@ -1268,18 +1369,9 @@ class Tenant(ha_base.ClusterProtocol):
 
         # Triggered by a postgres notification event 'database-config-changes'
         # on the __edgedb_sysevent__ channel
-        async def task():
-            try:
-                await self.introspect_db(dbname)
-            except Exception:
-                metrics.background_errors.inc(
-                    1.0,
-                    self._instance_name,
-                    "on_remote_database_config_change",
-                )
-                raise
-
-        self.create_task(task(), interruptable=True)
+        self._schedule_introspect_db(
+            dbname, "on_remote_database_config_change"
+        )
 
     def on_local_database_config_change(self, dbname: str) -> None:
         if not self._accept_new_tasks:
@@ -1288,16 +1380,9 @@ class Tenant(ha_base.ClusterProtocol):
         # Triggered by DB Index.
         # It's easier and safer to just schedule full re-introspection
         # of the DB and update all components of it.
-        async def task():
-            try:
-                await self.introspect_db(dbname)
-            except Exception:
-                metrics.background_errors.inc(
-                    1.0, self._instance_name, "on_local_database_config_change"
-                )
-                raise
-
-        self.create_task(task(), interruptable=True)
+        self._schedule_introspect_db(
+            dbname, "on_local_database_config_change"
+        )
 
     def on_remote_system_config_change(self) -> None:
         if not self._accept_new_tasks:
@@ -1308,9 +1393,17 @@ class Tenant(ha_base.ClusterProtocol):
 
         async def task():
             try:
+                idle_timeout = self._server.config_lookup(
+                    "session_idle_timeout", self.get_sys_config()
+                )
                 cfg = await self._load_sys_config()
                 self._dbindex.update_sys_config(cfg)
-                self._server.reinit_idle_gc_collector()
+                # Rescheduling the idle GC restarts its timer, so only
+                # do it if the timeout has actually changed.
+                if idle_timeout != self._server.config_lookup(
+                    "session_idle_timeout", self.get_sys_config()
+                ):
+                    self._server.reinit_idle_gc_collector()
             except Exception:
                 metrics.background_errors.inc(
                     1.0, self._instance_name, "on_remote_system_config_change"
@@ -1348,6 +1441,19 @@ class Tenant(ha_base.ClusterProtocol):
             pg_pool=self._pg_pool._build_snapshot(now=time.monotonic()),
         )
 
+        # Most connections share the same (usually empty) session config
+        # map, so serialize each distinct map only once.  The map is kept
+        # next to its serialization so that its id() cannot be reused.
+        serialized_configs: dict[int, tuple[Any, Any]] = {}
+
+        def serialize_config(cfg):
+            try:
+                return serialized_configs[id(cfg)][1]
+            except KeyError:
+                rv = config.debug_serialize_config(cfg)
+                serialized_configs[id(cfg)] = (cfg, rv)
+                return rv
+
         dbs = {}
         if self._dbindex is not None:
             for db in self._dbindex.iter_dbs():
@@ -1368,7 +1474,7 @@ class Tenant(ha_base.ClusterProtocol):
                         dict(
                             in_tx=view.in_tx(),
                             in_tx_error=view.in_tx_error(),
-                            config=config.debug_serialize_config(
+                            config=serialize_config(
                                 view.get_session_config()),
                             module_aliases=view.get_modaliases(),
                         )
@@ -1385,5 +1491,6 @@ class Tenant(ha_base.ClusterProtocol):
         return {"dbindex": self._dbindex}
 
     def iter_dbs(self) -> Iterator[dbview.Database]:
-        if self._dbindex is not None:
-            yield from self._dbindex.iter_dbs()
+        if self._dbindex is None:
+            return iter(())
+        return self._dbindex.iter_dbs()
@@ -414,3 +414,50 @@ class TestPrometheusClient(unittest.TestCase):
         pmc_r = run_pmc()
         emc_r = run_emc()
         self.assertEqual(pmc_r, emc_r)
+
+    def test_prometheus_09(self):
+        def run(bound):
+            r = EP.Registry(prefix='edgedb')
+
+            test_total = r.new_labeled_counter(
+                'test_total', 'A  test info', labels=('tenant',)
+            )
+            test_gauge = r.new_labeled_gauge(
+                'test_gauge', 'A  test info', labels=('tenant',)
+            )
+            test_hist = r.new_labeled_histogram(
+                'test_hist', 'A  test info', labels=('tenant',)
+            )
+
+            if bound:
+                total = test_total.labels('1')
+                gauge = test_gauge.labels('1')
+                hist = test_hist.labels('1')
+                total.inc()
+                total.inc(2.5)
+                gauge.inc(3)
+                gauge.dec()
+                hist.observe(0.22)
+                hist.observe(2.0)
+                r0 = r.generate()
+                gauge.set(10)
+            else:
+                test_total.inc(1.0, '1')
+                test_total.inc(2.5, '1')
+                test_gauge.inc(3, '1')
+                test_gauge.dec(1.0, '1')
+                test_hist.observe(0.22, '1')
+                test_hist.observe(2.0, '1')
+                r0 = r.generate()
+                test_gauge.set(10, '1')
+
+            r1 = r.generate()
+
+            with self.assertRaisesRegex(ValueError, 'missing values'):
+                test_total.labels()
+            with self.assertRaisesRegex(ValueError, 'empty value'):
+                test_gauge.labels('')
+
+            return [r0, r1]
+
+        self.assertEqual(run(bound=True), run(bound=False))
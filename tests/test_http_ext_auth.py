@@ -382,7 +382,12 @@ class TestHttpExtAuth(tb.ExtAuthTestCase):
     ]
 
     @classmethod
-    async def _wait_for_db_config(cls):
+    async def _wait_for_db_config(
+        cls,
+        config_key="ext::auth::AuthConfig::providers",
+        *,
+        is_set=True,
+    ):
         dbname = cls.get_database_name()
         # Wait for the database config changes to propagate to the
         # server by watching a debug endpoint
@@ -403,7 +408,7 @@ class TestHttpExtAuth(tb.ExtAuthTestCase):
                         # multi-tenant instance - use the first tenant
                         data = next(iter(data['tenants'].values()))
                     config = data['databases'][dbname]['config']
-                    if 'ext::auth::AuthConfig::providers' not in config:
+                    if (config_key in config) != is_set:
                         raise AssertionError('database config not ready')
 
     @classmethod
@@ -839,6 +844,165 @@ class TestHttpExtAuth(tb.ExtAuthTestCase):
                 new_session_claims.get("exp") > session_claims.get("exp")
             )
 
+    async def test_http_auth_ext_github_callback_02(self):
+        with MockAuthProvider() as mock_provider, self.http_con() as http_con:
+            provider_config = await self.get_builtin_provider_config_by_name(
+                "oauth_github"
+            )
+            provider_name = provider_config.name
+
+            now = utcnow()
+            token_request = (
+                "POST",
+                "https://github.com",
+                "/login/oauth/access_token",
+            )
+            # Only a refresh token: both stored provider tokens are
+            # replaced, so the stale access token is cleared.
+            mock_provider.register_route_handler(*token_request)(
+                (
+                    json.dumps(
+                        {
+                            "refresh_token": "github_refresh_token",
+                            "scope": "read:user",
+                            "token_type": "bearer",
+                        }
+                    ),
+                    200,
+                )
+            )
+
+            user_request = ("GET", "https://api.github.com", "/user")
+            mock_provider.register_route_handler(*user_request)(
+                (
+                    json.dumps(
+                        {
+                            "id": 2,
+                            "login": "octocat2",
+                            "name": "monalisa octocat",
+                            "email": "octocat2@example.com",
+                            "avatar_url": "http://example.com/example.jpg",
+                            "updated_at": now.isoformat(),
+                        }
+                    ),
+                    200,
+                )
+            )
+
+            challenge = (
+                base64.urlsafe_b64encode(
+                    hashlib.sha256(
+                        base64.urlsafe_b64encode(os.urandom(43)).rstrip(b'=')
+                    ).digest()
+                )
+                .rstrip(b'=')
+                .decode()
+            )
+            pkce_challenge = await self.con.query_single(
+                """
+                insert ext::auth::PKCEChallenge {
+                    challenge := <str>$challenge,
+                    auth_token := 'stored_auth_token',
+                    refresh_token := 'stored_refresh_token',
+                }
+                """,
+                challenge=challenge,
+            )
+
+            signing_key = await self.get_signing_key()
+
+            expires_at = now + datetime.timedelta(minutes=5)
+            state_claims = {
+                "iss": self.http_addr,
+                "provider": str(provider_name),
+                "exp": expires_at.timestamp(),
+                "redirect_to": f"{self.http_addr}/some/path",
+                "challenge": challenge,
+            }
+            state_token = self.generate_state_value(state_claims, signing_key)
+
+            data, headers, status = self.http_con_request(
+                http_con,
+                {"state": state_token, "code": "abc123"},
+                path="callback",
+            )
+
+            self.assertEqual(data, b"")
+            self.assertEqual(status, 302)
+
+            location = headers.get("location")
+            assert location is not None
+            url = urllib.parse.urlparse(location)
+            qs = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+            self.assertEqual(qs.get("code"), [str(pkce_challenge.id)])
+
+            identity = await self.con.query_single(
+                """
+                SELECT ext::auth::Identity
+                FILTER .subject = '2'
+                AND .issuer = 'https://github.com'
+                """
+            )
+
+            pkce_object = await self.con.query(
+                """
+                SELECT ext::auth::PKCEChallenge {
+                    id,
+                    auth_token,
+                    refresh_token,
+                    identity_id := .identity.id,
+                }
+                FILTER .challenge = <str>$challenge
+                """,
+                challenge=challenge,
+            )
+
+            self.assertEqual(len(pkce_object), 1)
+            self.assertEqual(pkce_object[0].id, pkce_challenge.id)
+            self.assertEqual(pkce_object[0].identity_id, identity.id)
+            self.assertIsNone(pkce_object[0].auth_token)
+            self.assertEqual(
+                pkce_object[0].refresh_token, "github_refresh_token"
+            )
+
+            # No provider tokens at all: the stored ones are kept.
+            mock_provider.register_route_handler(*token_request)(
+                (
+                    json.dumps(
+                        {
+                            "scope": "read:user",
+                            "token_type": "bearer",
+                        }
+                    ),
+                    200,
+                )
+            )
+
+            _, _, status = self.http_con_request(
+                http_con,
+                {"state": state_token, "code": "abc123"},
+                path="callback",
+            )
+
+            self.assertEqual(status, 302)
+
+            pkce_object = await self.con.query(
+                """
+                SELECT ext::auth::PKCEChallenge {
+                    auth_token,
+                    refresh_token,
+                }
+                FILTER .challenge = <str>$challenge
+                """,
+                challenge=challenge,
+            )
+
+            self.assertEqual(len(pkce_object), 1)
+            self.assertIsNone(pkce_object[0].auth_token)
+            self.assertEqual(
+                pkce_object[0].refresh_token, "github_refresh_token"
+            )
+
     async def test_http_auth_ext_github_callback_failure_01(self):
         with MockAuthProvider() as mock_provider, self.http_con() as http_con:
             provider_config = await self.get_builtin_provider_config_by_name(
@@ -2287,6 +2451,79 @@ class TestHttpExtAuth(tb.ExtAuthTestCase):
                 auth_data_redirect_on_failure["redirect_on_failure"],
             )
 
+    async def test_http_auth_ext_local_password_authenticate_02(self):
+        with self.http_con() as http_con:
+            provider_config = await self.get_builtin_provider_config_by_name(
+                "local_emailpassword"
+            )
+            provider_name = provider_config.name
+
+            form_data = {
+                "provider": provider_name,
+                "email": "test_auth_02@example.com",
+                "password": "test_auth_password",
+                "challenge": str(uuid.uuid4()),
+            }
+            form_data_encoded = urllib.parse.urlencode(form_data).encode()
+
+            self.http_con_request(
+                http_con,
+                None,
+                path="register",
+                method="POST",
+                body=form_data_encoded,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+
+            identity = await self.con.query_single(
+                """
+                SELECT ext::auth::LocalIdentity
+                FILTER .<identity[is ext::auth::EmailPasswordFactor]
+                       .email = 'test_auth_02@example.com';
+                """
+            )
+
+            # Authenticating repeatedly with the same challenge must reuse
+            # the existing PKCE challenge rather than create a new one.
+            auth_data = {
+                "provider": form_data["provider"],
+                "email": form_data["email"],
+                "password": form_data["password"],
+                "challenge": str(uuid.uuid4()),
+            }
+            auth_data_encoded = urllib.parse.urlencode(auth_data).encode()
+
+            codes = []
+            for _ in range(2):
+                body, _, status = self.http_con_request(
+                    http_con,
+                    None,
+                    path="authenticate",
+                    method="POST",
+                    body=auth_data_encoded,
+                    headers={
+                        "Content-Type": "application/x-www-form-urlencoded"
+                    },
+                )
+
+                self.assertEqual(status, 200, body)
+                codes.append(json.loads(body)["code"])
+
+            pkce_challenges = await self.con.query(
+                """
+                SELECT ext::auth::PKCEChallenge {
+                    id,
+                    identity_id := .identity.id,
+                }
+                FILTER .challenge = <str>$challenge
+                """,
+                challenge=auth_data["challenge"],
+            )
+
+            self.assertEqual(len(pkce_challenges), 1)
+            self.assertEqual(codes, [str(pkce_challenges[0].id)] * 2)
+            self.assertEqual(pkce_challenges[0].identity_id, identity.id)
+
     async def test_http_auth_ext_token_01(self):
         with self.http_con() as http_con:
             # Create a PKCE challenge and verifier
@@ -2724,3 +2961,47 @@ class TestHttpExtAuth(tb.ExtAuthTestCase):
                 parsed_query.get("error"),
                 ["Invalid 'reset_token'"],
             )
+
+    async def test_http_auth_ext_ui_pages_01(self):
+        await self.con.execute(
+            """
+            CONFIGURE CURRENT DATABASE
+            INSERT ext::auth::UIConfig {
+                redirect_to := 'https://example.com/app',
+            };
+            """
+        )
+        try:
+            await self._wait_for_db_config("ext::auth::AuthConfig::ui")
+
+            with self.http_con() as http_con:
+                for path, expected in [
+                    ("ui/forgot-password", b"Send Reset Email"),
+                    ("ui/reset-password", b"Reset token is invalid"),
+                    ("ui/verify", b"Missing email verification token."),
+                    (
+                        "ui/resend-verification",
+                        b"Missing verification token",
+                    ),
+                ]:
+                    with self.subTest(path=path):
+                        body, headers, status = self.http_con_request(
+                            http_con,
+                            None,
+                            path=path,
+                        )
+
+                        self.assertEqual(status, 200, body)
+                        self.assertEqual(
+                            headers.get("content-type"), "text/html"
+                        )
+                        self.assertIn(expected, body)
+        finally:
+            await self.con.execute(
+                """
+                CONFIGURE CURRENT DATABASE RESET ext::auth::UIConfig;
+                """
+            )
+            await self._wait_for_db_config(
+                "ext::auth::AuthConfig::ui", is_set=False
+            )
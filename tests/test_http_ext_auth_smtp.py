@@ -0,0 +1,139 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2023-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+import unittest.mock
+
+import aiosmtplib
+
+from edb.testbase import server as tbs
+from edb.server.protocol.auth_ext import smtp
+
+
+class FakeSMTP:
+    instances: list["FakeSMTP"] = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.is_connected = False
+        self.closed = False
+        self.fail_noop = False
+        self.noops = 0
+        self.sent = []
+        FakeSMTP.instances.append(self)
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def noop(self):
+        self.noops += 1
+        if self.fail_noop:
+            raise aiosmtplib.SMTPResponseException(421, "closing")
+
+    async def sendmail(self, sender, recipients, message):
+        self.sent.append((sender, recipients, message))
+
+    async def send_message(self, message, *, sender, recipients):
+        self.sent.append((sender, recipients, message))
+
+    def close(self):
+        self.is_connected = False
+        self.closed = True
+
+
+class TestSMTPConnectionPool(tbs.TestCase):
+
+    SMTP_ARGS = dict(
+        hostname="localhost",
+        port=1025,
+        username=None,
+        password=None,
+        timeout=1.0,
+        use_tls=False,
+        start_tls=False,
+        validate_certs=False,
+    )
+
+    @classmethod
+    def uses_server(cls) -> bool:
+        return False
+
+    def setUp(self):
+        super().setUp()
+        FakeSMTP.instances = []
+        patches = [
+            unittest.mock.patch.object(smtp.aiosmtplib, "SMTP", FakeSMTP),
+            unittest.mock.patch.dict(smtp._idle_connections, clear=True),
+            unittest.mock.patch.object(smtp, "_idle_reaper", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self._cancel_reaper)
+
+    def _cancel_reaper(self):
+        if smtp._idle_reaper is not None:
+            smtp._idle_reaper.cancel()
+
+    async def send(self, body="hello"):
+        await smtp._send_pooled(
+            body,
+            sender="noreply@example.com",
+            recipients=["user@example.com"],
+            **self.SMTP_ARGS,
+        )
+
+    async def test_http_auth_ext_smtp_pool_reuse_01(self):
+        await self.send("first")
+        await self.send("second")
+
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        conn = FakeSMTP.instances[0]
+        self.assertEqual([m for _, _, m in conn.sent], ["first", "second"])
+        self.assertEqual(conn.noops, 1)
+        self.assertFalse(conn.closed)
+        self.assertIsNotNone(smtp._idle_reaper)
+
+    async def test_http_auth_ext_smtp_pool_noop_failure_01(self):
+        await self.send("first")
+        stale = FakeSMTP.instances[0]
+        stale.fail_noop = True
+
+        await self.send("second")
+
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertTrue(stale.closed)
+        self.assertEqual([m for _, _, m in stale.sent], ["first"])
+
+        fresh = FakeSMTP.instances[1]
+        self.assertEqual([m for _, _, m in fresh.sent], ["second"])
+        self.assertFalse(fresh.closed)
+
+    async def test_http_auth_ext_smtp_pool_idle_reaper_01(self):
+        with unittest.mock.patch.object(smtp, "_IDLE_TIMEOUT", 0.01):
+            await self.send()
+            conn = FakeSMTP.instances[0]
+            self.assertFalse(conn.closed)
+            self.assertIsNotNone(smtp._idle_reaper)
+
+            await asyncio.sleep(0.2)
+
+            self.assertTrue(conn.closed)
+            self.assertEqual(smtp._idle_connections, {})
+            self.assertIsNone(smtp._idle_reaper)
@@ -1407,6 +1407,45 @@ class TestServerConnectionPool(unittest.TestCase):
 
         asyncio.run(main())
 
+    def test_connpool_acquire_healthy(self):
+        async def test():
+            disconnected = []
+            disconnect = self.make_fake_disconnect()
+
+            async def fake_disconnect(conn):
+                disconnected.append(conn)
+                await disconnect(conn)
+
+            pool = connpool.Pool(
+                connect=self.make_fake_connect(),
+                disconnect=fake_disconnect,
+                max_capacity=5,
+            )
+
+            conn1 = await pool.acquire('A')
+            conn2 = await pool.acquire('A')
+            pool.release('A', conn1)
+            pool.release('A', conn2)
+
+            # conn2 is on top of the stack and would be handed out next.
+            broken = {conn2}
+            conn = await pool.acquire_healthy(
+                'A', lambda c: c not in broken)
+            self.assertIs(conn, conn1)
+            pool.release('A', conn)
+
+            # All idle connections are broken, a new one must be made.
+            broken.add(conn1)
+            conn = await pool.acquire_healthy(
+                'A', lambda c: c not in broken)
+            self.assertNotIn(conn, broken)
+            pool.release('A', conn)
+
+            await asyncio.sleep(0.1)
+            self.assertCountEqual(disconnected, [conn1, conn2])
+
+        asyncio.run(asyncio.wait_for(test(), timeout=5))
+
     class MockLogger(logging.Logger):
         logs: asyncio.Queue
 